@@ -1,6 +1,16 @@
+import bisect
+import collections
+import functools
 import json
+import operator
+import time
 from py_expression_eval import Parser  # You'll need to install this library
 
+try:
+    import numpy as np
+except ImportError:  # NumPy only speeds up aggregations over large entities
+    np = None
+
 # Rule definition in JSON format
 rule_json = """
 {
@@ -227,7 +237,7 @@ rule_json = """
     },
     {
       "entity": "calendar",
-      "filters":,
+      "filters": [],
       "op": "and",
       "terms": [
         {
@@ -284,7 +294,9 @@ data = {
             }
         ]
     },
-    "day_of_week": "Friday"
+    "calendar": {
+        "day_of_week": "Friday"
+    }
 }
 
 # Provide input variables
@@ -298,106 +310,930 @@ variables = {
 # Initialize JUEL expression parser
 parser = Parser()
 
-def evaluate_rule(rule, data, variables):
-    conditions = rule["conditions"]
-
-    def evaluate_condition(condition, data):
-        if "filters" in condition:
-            filter_results = [evaluate_filter(filter, data) for filter in condition["filters"]]
-            if not all(filter_results):
-                return False
-
-        if "op" in condition:
-            results = [evaluate_condition(term, data) for term in condition["terms"]]
-            if condition["op"] == "and":
-                return all(results)
-            elif condition["op"] == "or":
-                return any(results)
+# Number of distinct expression texts kept parsed
+EXPRESSION_CACHE_SIZE = 1024
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def parse_expression(expression):
+    """Parse a JUEL expression (including its ${} wrapper), cached by expression text.
+
+    Hit/miss counters are available through parse_expression.cache_info().
+    """
+    return parser.parse(expression[2:-1])  # Remove ${} from JUEL expression
+
+# Comparison operators, resolved once when a rule is compiled
+def _ordered(compare):
+    """Wrap an ordering comparison so missing values compare as False instead of raising."""
+    def wrapped(actual, expected):
+        if actual is None or expected is None:
+            return False
+        return compare(actual, expected)
+    return wrapped
+
+OPERATORS = {
+    "equals": operator.eq,
+    "not_equals": operator.ne,
+    "gt": _ordered(operator.gt),
+    "gte": _ordered(operator.ge),
+    "lt": _ordered(operator.lt),
+    "lte": _ordered(operator.le),
+}
+
+# Declared term/filter types: the Python types that compare natively, and a coercion
+# for anything else that returns None when the value can't be converted
+def _to_number(value):
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_bool(value):
+    if isinstance(value, str):
+        return {"true": True, "false": False}.get(value.strip().lower())
+    if isinstance(value, (int, float)):
+        return bool(value)
+    return None
+
+TYPES = {
+    "string": ((str,), str),
+    "integer": ((int, float), _to_number),
+    "number": ((int, float), _to_number),
+    "boolean": ((bool,), _to_bool),
+}
+
+def coerce_constant(value, type_name):
+    """Convert a rule literal to its declared type, raising ValueError if it can't be."""
+    if type_name not in TYPES or value is None:
+        return value
+    py_types, coerce = TYPES[type_name]
+    if type(value) in py_types:
+        return value
+    coerced = coerce(value)
+    if coerced is None:
+        raise ValueError(f"Value {value!r} is not a valid {type_name}")
+    return coerced
+
+def _coercer(type_name):
+    """fn(value) -> value converted to a declared type, or None for untyped terms."""
+    if type_name not in TYPES:
+        return None
+    py_types, coerce = TYPES[type_name]
+
+    def coerce_value(value):
+        if value is None or type(value) in py_types:
+            return value
+        if type(value) is FanOut:
+            return FanOut(coerce_value(item) for item in value)
+        return coerce(value)
+    return coerce_value
+
+def _typed(compare, type_name):
+    """Specialize a comparison for a declared type.
+
+    Operands that already have the type compare directly; anything else (an int
+    customer_id against a string-typed filter) is coerced first.
+    """
+    if type_name not in TYPES:
+        return compare
+    py_types, coerce = TYPES[type_name]
+
+    def typed(actual, expected):
+        if type(actual) not in py_types and actual is not None:
+            actual = coerce(actual)
+        if type(expected) not in py_types and expected is not None:
+            expected = coerce(expected)
+        return compare(actual, expected)
+    return typed
+
+class FanOut(list):
+    """Values collected by a field path that passes through a list, e.g. branch.suppliers.supplier_type.
+
+    A comparison against a FanOut passes when any of its values passes.
+    """
+
+def get_field_value(data, fields):
+    """Walk a pre-split field path through nested dicts, fanning out over lists along the way."""
+    value = data
+    for i, field in enumerate(fields):
+        if isinstance(value, list):
+            return _fan_out(value, fields[i:])
+        if not isinstance(value, dict):
+            return None
+        value = value.get(field)
+        if value is None:
+            return None
+    return value
+
+def _fan_out(rows, fields):
+    values = FanOut()
+    for row in rows:
+        value = get_field_value(row, fields)
+        if type(value) is FanOut:
+            values.extend(value)
+        elif value is not None:
+            values.append(value)
+    return values
+
+def _matches(compare, actual, expected):
+    if type(actual) is FanOut:
+        return any(compare(value, expected) for value in actual)
+    return compare(actual, expected)
+
+# Lists with at least this many rows get per-evaluation indexes for their filters
+INDEX_THRESHOLD = 32
+
+RANGE_OPERATORS = {"gt", "gte", "lt", "lte"}
+
+def _build_index(comp, rows, fields, coerce=None):
+    """Hash index (value -> rows) for equals, or sorted (values, positions) for range operators.
+
+    Values are keyed after coercion to the filter's declared type, if it has one.
+    """
+    field_value = get_field_value if coerce is None else lambda row, fields: coerce(get_field_value(row, fields))
+    if comp == "equals":
+        index = {}
+        for row in rows:
+            try:
+                index.setdefault(field_value(row, fields), []).append(row)
+            except TypeError:  # Unhashable values (lists, fan-outs) can't be indexed
+                return None
+        return index
+    pairs = [(value, position) for position, row in enumerate(rows)
+             if (value := field_value(row, fields)) is not None]
+    try:
+        pairs.sort(key=lambda pair: pair[0])
+    except TypeError:  # Values of mixed types have no order
+        return None
+    return [value for value, _ in pairs], [position for _, position in pairs]
+
+def _index_lookup(indexes, rows, fields, comp, expected, type_name=None):
+    """Rows matching one filter through an index built once per evaluation, or None if unindexable."""
+    kind = "hash" if comp == "equals" else "sorted"
+    key = (id(rows), kind, tuple(fields), type_name)
+    entry = indexes.get(key)
+    if entry is None or entry[0] is not rows:  # Holding rows keeps its id from being reused
+        entry = indexes[key] = (rows, _build_index(comp, rows, fields, _coercer(type_name)))
+    index = entry[1]
+    if index is None:
+        return None
+    try:
+        if comp == "equals":
+            return index.get(expected, [])
+        values, positions = index
+        if comp == "gt":
+            selected = positions[bisect.bisect_right(values, expected):]
+        elif comp == "gte":
+            selected = positions[bisect.bisect_left(values, expected):]
+        elif comp == "lt":
+            selected = positions[:bisect.bisect_left(values, expected)]
         else:
-            return evaluate_term(condition, data)
+            selected = positions[:bisect.bisect_right(values, expected)]
+    except TypeError:
+        return None
+    return [rows[position] for position in sorted(selected)]
+
+# Aggregate functions for list-valued entities; values never contain None
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+AGGREGATES = {
+    "sum": sum,
+    "count": len,
+    "min": lambda values: min(values) if values else None,
+    "max": lambda values: max(values) if values else None,
+    "avg": _mean,
+    "distinct_count": lambda values: len(set(values)),
+}
+
+# Entities with at least this many rows are aggregated through NumPy masks
+AGGREGATE_VECTOR_THRESHOLD = 500
+
+if np is not None:
+    VECTOR_OPERATORS = {
+        "equals": np.equal,
+        "not_equals": np.not_equal,
+        "gt": np.greater,
+        "gte": np.greater_equal,
+        "lt": np.less,
+        "lte": np.less_equal,
+    }
+
+    # sum and avg are totalled exactly in _aggregate_rows
+    VECTOR_AGGREGATES = {
+        "count": len,
+        "min": np.min,
+        "max": np.max,
+        "distinct_count": lambda values: len(np.unique(values)),
+    }
+
+def vector_compare(comp, actual, expected):
+    """Compare a column against a scalar or a column in one vectorized step.
+
+    Columns that NumPy cannot compare natively (mixed objects, None) fall back to
+    the scalar OPERATORS table element by element.
+    """
+    try:
+        result = VECTOR_OPERATORS[comp](actual, expected)
+        if isinstance(result, np.ndarray) and result.dtype == bool:
+            return result
+    except TypeError:
+        pass
+    compare = np.frompyfunc(OPERATORS[comp], 2, 1)
+    return compare(actual, expected).astype(bool)
+
+INT64_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+def _column_array(values):
+    """Build a NumPy column, keeping a native dtype only when it holds every value exactly.
+
+    ints become int64 when they all fit and floats float64; a mix of the two, like
+    anything else, stays an object column.
+    """
+    kinds = {type(value) for value in values}
+    if kinds == {int} and INT64_RANGE[0] <= min(values) and max(values) <= INT64_RANGE[1]:
+        return np.array(values, dtype=np.int64)
+    if kinds == {float}:
+        return np.array(values, dtype=float)
+    if kinds == {str}:
+        return np.array(values)
+    column = np.empty(len(values), dtype=object)  # Element by element, so FanOut lists stay values
+    for i, value in enumerate(values):
+        column[i] = value
+    return column
+
+def _exact_total(values):
+    """Sum of an int64 or float64 column, equal to sum() over the same values row by row."""
+    if values.dtype.kind == "i":
+        largest = max(-int(values.min()), int(values.max()))
+        if largest * len(values) <= INT64_RANGE[1]:  # Cannot overflow int64
+            return int(np.sum(values))
+    return sum(values.tolist())  # Python's order and int precision
+
+def _aggregate_rows(func, rows, fields, type_name, filters, bound):
+    """Aggregate a field over rows passing every filter, as NumPy masks over extracted columns.
+
+    Columns are extracted already coerced to the declared type of the term or filter reading them.
+    """
+    columns = {}
+
+    def column(path, type_name=None):
+        key = (tuple(path), type_name)
+        if key not in columns:
+            values = [get_field_value(row, path) for row in rows]
+            coerce = _coercer(type_name)
+            columns[key] = _column_array(list(map(coerce, values)) if coerce else values)
+        return columns[key]
+
+    mask = np.ones(len(rows), dtype=bool)
+    for evaluate_filter in filters:
+        mask &= evaluate_filter(column, bound)
+    values = column(fields, type_name)[mask]
+    if values.dtype.kind not in "if":
+        # Strings, None and mixed types aggregate in Python, as on the row-by-row path
+        items = []
+        for value in values.tolist():
+            if type(value) is FanOut:
+                items.extend(value)
+            elif value is not None:
+                items.append(value)
+        return AGGREGATES[func](items)
+    if not len(values):
+        return AGGREGATES[func]([])
+    if func in ("sum", "avg"):
+        total = _exact_total(values)
+        return total if func == "sum" else total / len(values)
+    result = VECTOR_AGGREGATES[func](values)
+    return result.item() if hasattr(result, "item") else result
+
+def get_rule_name(rule):
+    """Rule name from the metadata block (rule_name in v3 rules, ruleName in v5/v6)."""
+    metadata = rule.get("metadata", {})
+    return metadata.get("ruleName") or metadata.get("rule_name")
+
+class CompiledRule:
+    """A rule whose conditions tree has been turned into a tree of callables."""
+
+    def __init__(self, rule, predicate, variable_names):
+        self.rule = rule
+        self.name = get_rule_name(rule)
+        self.predicate = predicate
+        self.variable_names = variable_names
+
+    def bind(self, variables):
+        """Resolve the rule's $variable references into positional slots.
+
+        Slots whose name starts with a space are per-evaluation scratch space (memo, indexes).
+        """
+        return [{} if name.startswith(" ") else variables.get(name) for name in self.variable_names]
+
+    def evaluate(self, data, variables):
+        return self.predicate(data, [data], self.bind(variables))
+
+class PassRateStats:
+    """Observed evaluation and pass counts per node path (e.g. "conditions[1].terms[2]").
+
+    Collected when a rule is compiled with stats=..., and used by optimize=True to
+    order sibling terms so the ones most likely to decide the result run first.
+    """
+
+    def __init__(self):
+        self.counts = {}
+
+    def counter(self, path):
+        return self.counts.setdefault(path, [0, 0])
+
+    def pass_rate(self, path):
+        evaluated, passed = self.counts.get(path, (0, 0))
+        return (passed + 1) / (evaluated + 2)  # Unseen nodes sit at 0.5
+
+def _label(value):
+    """Escape a Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class RuleProfile:
+    """Per-node wall time, call count and pass/fail counts for a rule compiled with profile=...
+
+    Nodes are addressed by the same stable paths as PassRateStats; the whole rule is
+    recorded under the empty path.
+    """
+
+    def __init__(self, rule_name="rule"):
+        self.rule_name = rule_name
+        self.nodes = {}  # path -> [calls, passed, total_ns]
+
+    def node(self, path):
+        return self.nodes.setdefault(path, [0, 0, 0])
+
+    def _self_ns(self, path):
+        prefix = f"{path}." if path else ""
+        children = sum(total for child, (_, _, total) in self.nodes.items()
+                       if child and child != path and child.startswith(prefix) and "." not in child[len(prefix):])
+        return max(0, self.nodes[path][2] - children)
+
+    def collapsed_stacks(self):
+        """Folded stack lines ("rule;conditions[1];terms[2] <self ns>") for flamegraph.pl or speedscope."""
+        lines = []
+        for path in sorted(self.nodes):
+            self_ns = self._self_ns(path)
+            if self_ns:
+                frames = [self.rule_name] + (path.split(".") if path else [])
+                lines.append(f"{';'.join(frames)} {self_ns}")
+        return "\n".join(lines) + "\n"
+
+    def prometheus(self):
+        """Counters in the Prometheus text exposition format."""
+        metrics = [("rule_node_calls_total", "Evaluations of a rule node", lambda node: node[0]),
+                   ("rule_node_passed_total", "Evaluations of a rule node that passed", lambda node: node[1]),
+                   ("rule_node_failed_total", "Evaluations of a rule node that failed", lambda node: node[0] - node[1]),
+                   ("rule_node_seconds_total", "Wall time spent in a rule node", lambda node: node[2] / 1e9)]
+        lines = []
+        for name, help, value in metrics:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} counter")
+            for path in sorted(self.nodes):
+                lines.append(f'{name}{{rule="{_label(self.rule_name)}",path="{_label(path)}"}} {value(self.nodes[path])}')
+        return "\n".join(lines) + "\n"
 
-    def evaluate_filter(filter, data):
-        field = filter["field"]
-        comp = filter["operator"]
-        value = filter["value"]
-        optional = filter.get("optional", False)
+class _CompileContext:
+    def __init__(self, stats=None, optimize=False, share=False, profile=None):
+        self.slots = {}
+        self.stats = stats
+        self.profile = profile
+        self.optimize = optimize
+        self.share = share
+        self.node_ids = {}
+        if share:
+            # Per-evaluation memo of shared node results, carried in its own slot
+            self.memo_index = _slot(" memo", self)
 
-        if isinstance(value, dict) and "expr" in value:
-            value = evaluate_expression(value["expr"], data)
+# A compiled node: predicate fn(row, rows, bound), whether it depends on the
+# current row (aggregates don't), its estimated cost and its stable path
+_Compiled = collections.namedtuple("_Compiled", "predicate per_row cost path")
 
-        if value.startswith("$"):
-            value = variables.get(value[1:])
-            if value is None and optional:
+# Relative cost estimates used to order sibling terms
+TERM_COST = 1
+EXPRESSION_COST = 3
+AGGREGATE_COST = 10
+ENTITY_COST = 2
+ENTITY_FANOUT = 4  # Terms under an entity may run once per entity row
+
+def _slot(name, ctx):
+    """Return the slot index for a variable name, allocating one if needed."""
+    if name not in ctx.slots:
+        ctx.slots[name] = len(ctx.slots)
+    return ctx.slots[name]
+
+def _observed(predicate, path, ctx):
+    """Wrap a predicate to count passes and time calls when stats or a profile are collected.
+
+    Without either, the predicate is returned as is, so instrumentation costs nothing.
+    """
+    if ctx.stats is not None:
+        predicate = _counted(predicate, ctx.stats.counter(path))
+    if ctx.profile is not None:
+        predicate = _timed(predicate, ctx.profile.node(path))
+    return predicate
+
+def _counted(predicate, counts):
+    def counted(*args):
+        result = predicate(*args)
+        counts[0] += 1
+        if result:
+            counts[1] += 1
+        return result
+    return counted
+
+def _timed(predicate, node):
+    clock = time.perf_counter_ns
+
+    def timed(*args):
+        start = clock()
+        result = predicate(*args)
+        node[2] += clock() - start
+        node[0] += 1
+        if result:
+            node[1] += 1
+        return result
+    return timed
+
+def _node_id(kind, node, ctx):
+    """Identify structurally identical nodes across all rules compiled with one context."""
+    return ctx.node_ids.setdefault((kind, json.dumps(node, sort_keys=True)), len(ctx.node_ids))
+
+def _shared(predicate, node, ctx):
+    """Memoize a node's result per evaluation so identical nodes in other rules reuse it."""
+    if not ctx.share:
+        return predicate
+    node_id = _node_id("node", node, ctx)
+    memo_index = ctx.memo_index
+
+    def shared(row, rows, bound):
+        memo = bound[memo_index]
+        key = (node_id, id(row), id(rows))
+        try:
+            return memo[key]
+        except KeyError:
+            result = memo[key] = predicate(row, rows, bound)
+            return result
+    return shared
+
+def _shared_filter(predicate, filter, ctx):
+    if not ctx.share:
+        return predicate
+    node_id = _node_id("filter", filter, ctx)
+    memo_index = ctx.memo_index
+
+    def shared(row, bound):
+        memo = bound[memo_index]
+        key = (node_id, id(row))
+        try:
+            return memo[key]
+        except KeyError:
+            result = memo[key] = predicate(row, bound)
+            return result
+    return shared
+
+def _order(children, op, ctx):
+    """Order siblings so cheap terms likely to decide an and/or run first."""
+    if not ctx.optimize:
+        return children
+
+    def expected_cost(child):
+        rate = ctx.stats.pass_rate(child.path) if ctx.stats is not None else 0.5
+        decides = 1 - rate if op == "and" else rate
+        return child.cost / max(decides, 0.01)
+    return sorted(children, key=expected_cost)
+
+def _compile_value(value, ctx, type_name=None):
+    """Compile a literal, $variable or JUEL expression into a getter over the bound slots.
+
+    Literals and constant expressions are coerced to type_name here, once; variables
+    are left to the typed comparator. Returns the getter and, for $variable
+    references, the slot index (None otherwise).
+    """
+    if isinstance(value, dict) and "expr" in value:
+        expr = value["expr"]
+        if expr["language"] != "juel":
+            raise ValueError(f"Unsupported expression language: {expr['language']}")
+        parsed = parse_expression(expr["expression"])
+        if not parsed.variables():
+            constant = coerce_constant(parsed.evaluate({}), type_name)  # Fold constant expressions at compile time
+            return (lambda bound: constant), None
+        names = [(name, _slot(name, ctx)) for name in parsed.variables()]
+        return (lambda bound: parsed.evaluate({name: bound[index] for name, index in names})), None
+    if isinstance(value, str) and value.startswith("$"):
+        index = _slot(value[1:], ctx)
+        return (lambda bound: bound[index]), index
+    value = coerce_constant(value, type_name)
+    return (lambda bound: value), None
+
+def _value_cost(value):
+    return EXPRESSION_COST if isinstance(value, dict) and "expr" in value else TERM_COST
+
+def _filter_spec(filter, ctx):
+    """Resolve a filter's field path, operator, declared type and value getter once."""
+    type_name = filter.get("type")
+    get_value, index = _compile_value(filter["value"], ctx, type_name)
+    optional = filter.get("optional", False) and index is not None
+    return filter["field"].split("."), filter["operator"], type_name, get_value, index, optional
+
+def _compile_filter(spec):
+    """Compile a filter spec into fn(row, bound) -> bool."""
+    fields, comp, type_name, get_value, index, optional = spec
+    compare = _typed(OPERATORS[comp], type_name)
+
+    if optional:
+        def evaluate_filter(row, bound):
+            expected = bound[index]
+            if expected is None:
                 return True
+            return _matches(compare, get_field_value(row, fields), expected)
+    else:
+        def evaluate_filter(row, bound):
+            return _matches(compare, get_field_value(row, fields), get_value(bound))
+    return evaluate_filter
 
-        actual_value = get_field_value(data, field)
-        if comp == "equals":
-            return actual_value == value
-        elif comp == "gt":
-            return actual_value > value
-        # Add other comparison operators as needed
-
-    def evaluate_term(term, data):
-        field = term["field"]
-        func = term["function"]
-        comp = term["operator"]
-        value = term["value"]
-
-        if isinstance(value, dict) and "expr" in value:
-            value = evaluate_expression(value["expr"], data)
-
-        if func == "comp":
-            actual_value = get_field_value(data, field)
-            if comp == "equals":
-                return actual_value == value
-            elif comp == "gt":
-                return actual_value > value
-            # Add other comparison operators as needed
-        elif func == "sum":
-            # Apply filters before sum
-            filtered_data = data
-            if "filters" in term:
-                for filter in term["filters"]:
-                    filtered_data = [item for item in filtered_data if evaluate_filter(filter, item)]
-            values_to_sum = [get_field_value(item, field) for item in filtered_data]
-            sum_value = sum(values_to_sum)
-            return eval(f"{sum_value} {comp} {value}")
-
-    def get_field_value(data, field_path):
-        fields = field_path.split(".")
-        value = data
-        for field in fields:
-            if isinstance(value, list):
-                value = value  # Assuming single element in list for now
-            value = value.get(field)
-            if value is None:
-                return None
-        return value
+def _compile_vector_filter(spec):
+    """Compile a filter spec into fn(column, bound) -> row mask, column(fields, type) giving an array."""
+    fields, comp, type_name, get_value, index, optional = spec
+    coerce = _coercer(type_name) or (lambda value: value)
+
+    def evaluate_filter(column, bound):
+        expected = get_value(bound)
+        if optional and expected is None:
+            return True
+        return vector_compare(comp, column(fields, type_name), coerce(expected))
+    return evaluate_filter
+
+def _compile_lookup(specs, ctx):
+    """Compile fn(rows, bound) -> candidate rows, narrowed through an equals or range index.
+
+    Only lists of at least INDEX_THRESHOLD rows are indexed; the candidates still go
+    through every filter, so the lookup only has to be a superset.
+    """
+    indexable = [spec for spec in specs if spec[1] == "equals"] + \
+                [spec for spec in specs if spec[1] in RANGE_OPERATORS]
+    if not indexable:
+        return None
+    coercers = [_coercer(spec[2]) for spec in indexable]
+    indexes_index = _slot(" indexes", ctx)
+
+    def lookup(rows, bound):
+        if len(rows) < INDEX_THRESHOLD:
+            return rows
+        for (fields, comp, type_name, get_value, _, _), coerce in zip(indexable, coercers):
+            expected = get_value(bound)
+            if coerce is not None:
+                expected = coerce(expected)
+            if expected is None:
+                continue
+            candidates = _index_lookup(bound[indexes_index], rows, fields, comp, expected, type_name)
+            if candidates is not None:
+                return candidates
+        return rows
+    return lookup
+
+def _compile_filters(filters, ctx, path):
+    """Compile a filter list into fn(rows, bound) -> rows matching every filter."""
+    specs = []
+    compiled = []
+    for i, filter in enumerate(filters or []):
+        filter_path = f"{path}.filters[{i}]"
+        spec = _filter_spec(filter, ctx)
+        predicate = _observed(_shared_filter(_compile_filter(spec), filter, ctx), filter_path, ctx)
+        specs.append(spec)
+        compiled.append(_Compiled(predicate, True, _value_cost(filter["value"]), filter_path))
+    if not compiled:
+        return None
+    compiled = [filter.predicate for filter in _order(compiled, "and", ctx)]
+    lookup = _compile_lookup(specs, ctx)
+
+    def apply_filters(rows, bound):
+        if lookup:
+            rows = lookup(rows, bound)
+        return [row for row in rows if all(f(row, bound) for f in compiled)]
+    return apply_filters
+
+def _compile_rows(filters, ctx, path):
+    """Compile an entity's row selection into fn(target, bound) -> rows passing its filters."""
+    apply_filters = _compile_filters(filters, ctx, path)
+
+    def select_rows(target, bound):
+        rows = target if isinstance(target, list) else [target]
+        return apply_filters(rows, bound) if apply_filters else rows
+    if not ctx.share:
+        return select_rows
+    node_id = _node_id("rows", filters, ctx)
+    memo_index = ctx.memo_index
+
+    def shared(target, bound):
+        # The memo holds target and the selected list, so neither id can be reused
+        # while it lasts (fan-out targets are temporaries) and aggregates can key on rows
+        memo = bound[memo_index]
+        key = (node_id, id(target))
+        entry = memo.get(key)
+        if entry is None or entry[0] is not target:
+            entry = memo[key] = (target, select_rows(target, bound))
+        return entry[1]
+    return shared
+
+def _compile_aggregate(term, ctx, path):
+    """Compile an aggregate term into fn(row, rows, bound) -> bool over the entity rows.
+
+    The term's filters and the field extraction are fused into one pass; large
+    entities go through NumPy masks instead when NumPy is available, except while
+    stats or a profile are collected, so that every filter call is observed.
+    """
+    func = term["function"]
+    fields = term["field"].split(".")
+    type_name = term.get("type")
+    coerce = _coercer(type_name)
+    aggregate = AGGREGATES[func]
+    compare = _typed(OPERATORS[term["operator"]], type_name)
+    get_value, _ = _compile_value(term["value"], ctx, type_name)
+    specs = [_filter_spec(filter, ctx) for filter in term.get("filters") or []]
+    filters = [_observed(_compile_filter(spec), f"{path}.filters[{i}]", ctx) for i, spec in enumerate(specs)]
+    vectorize = np is not None and ctx.stats is None and ctx.profile is None
+    vector_filters = [_compile_vector_filter(spec) for spec in specs]
+    lookup = _compile_lookup(specs, ctx)
+
+    def evaluate_aggregate(row, rows, bound):
+        candidates = lookup(rows, bound) if lookup else rows
+        if candidates is rows and vectorize and len(rows) >= AGGREGATE_VECTOR_THRESHOLD:
+            result = _aggregate_rows(func, rows, fields, type_name, vector_filters, bound)
+        else:
+            values = []
+            for item in candidates:
+                if all(f(item, bound) for f in filters):
+                    value = get_field_value(item, fields)
+                    if coerce is not None:
+                        value = coerce(value)
+                    if type(value) is FanOut:
+                        values.extend(value)
+                    elif value is not None:
+                        values.append(value)
+            result = aggregate(values)
+        return compare(result, get_value(bound))
+    return evaluate_aggregate
+
+def _compile_term(term, ctx, path):
+    """Compile a leaf term. Aggregates don't depend on the current row; they read
+    the whole filtered entity instead."""
+    func = term["function"]
+    if func in AGGREGATES:
+        cost = AGGREGATE_COST + len(term.get("filters") or [])
+        return _Compiled(_compile_aggregate(term, ctx, path), False, cost, path)
+    if func != "comp":
+        raise ValueError(f"Unsupported term function: {func}")
+    fields = term["field"].split(".")
+    type_name = term.get("type")
+    compare = _typed(OPERATORS[term["operator"]], type_name)
+    get_value, _ = _compile_value(term["value"], ctx, type_name)
+
+    def evaluate_term(row, rows, bound):
+        return _matches(compare, get_field_value(row, fields), get_value(bound))
+    return _Compiled(evaluate_term, True, _value_cost(term["value"]), path)
+
+def _combine(op, children):
+    """Combine child predicates with and/or into fn(row, rows, bound) -> bool, short-circuiting."""
+    if op == "and":
+        def evaluate_and(row, rows, bound):
+            for child in children:
+                if not child(row, rows, bound):
+                    return False
+            return True
+        return evaluate_and
+    if op == "or":
+        def evaluate_or(row, rows, bound):
+            for child in children:
+                if child(row, rows, bound):
+                    return True
+            return False
+        return evaluate_or
+    raise ValueError(f"Unsupported op: {op}")
+
+def _compile_entity(node, ctx, path):
+    """Compile a condition scoped to an entity.
+
+    The entity is looked up on the current row and narrowed by its filters. A
+    list-valued entity passes when its aggregate terms hold over the filtered rows
+    and at least one filtered row satisfies the remaining terms.
+    """
+    fields = node["entity"].split(".")
+    select_rows = _compile_rows(node.get("filters") or [], ctx, path)
+    op = node.get("op", "and")
+    children = _order(_compile_children(node.get("terms", []), ctx, path), op, ctx)
+    aggregates = [child.predicate for child in children if not child.per_row]
+    per_row = [child.predicate for child in children if child.per_row]
+    steps = []
+    if aggregates:
+        aggregate = _combine(op, aggregates)
+        steps.append(lambda entity_rows, bound: aggregate(None, entity_rows, bound))
+    if per_row:
+        matches_row = _combine(op, per_row)
+        steps.append(lambda entity_rows, bound: any(matches_row(entity_row, entity_rows, bound)
+                                                    for entity_row in entity_rows))
+    if children and children[0].per_row:
+        steps.reverse()  # Follow the order of the cheapest/most decisive term
+    decisive = op == "or"
+
+    def evaluate_entity(row, rows, bound):
+        target = get_field_value(row, fields)
+        if target is None:
+            return False
+        entity_rows = select_rows(target, bound)
+        if not entity_rows:
+            return False
+        for step in steps:
+            if step(entity_rows, bound) == decisive:
+                return decisive
+        return not decisive
+
+    cost = ENTITY_COST + len(node.get("filters") or []) + ENTITY_FANOUT * sum(child.cost for child in children)
+    return _Compiled(evaluate_entity, True, cost, path)
+
+def _compile_children(terms, ctx, path):
+    return [_compile_node(term, ctx, f"{path}.terms[{i}]") for i, term in enumerate(terms)]
+
+def _compile_node(node, ctx, path):
+    """Compile any node of the conditions tree into a _Compiled."""
+    if "entity" in node:
+        compiled = _compile_entity(node, ctx, path)
+    elif "op" in node:
+        children = _order(_compile_children(node["terms"], ctx, path), node["op"], ctx)
+        compiled = _Compiled(_combine(node["op"], [child.predicate for child in children]),
+                             any(child.per_row for child in children),
+                             sum(child.cost for child in children), path)
+    else:
+        compiled = _compile_term(node, ctx, path)
+    return compiled._replace(predicate=_observed(_shared(compiled.predicate, node, ctx), path, ctx))
+
+def _compile_conditions(rule, ctx):
+    conditions = [_compile_node(condition, ctx, f"conditions[{i}]")
+                  for i, condition in enumerate(rule["conditions"])]
+    conditions = _order(conditions, "and", ctx)  # Assuming overall "and" condition
+    return _combine("and", [condition.predicate for condition in conditions])
+
+def compile_rule(rule, stats=None, optimize=False, profile=None, reoptimize_every=None):
+    """Compile a rule dict into a CompiledRule that can be evaluated repeatedly.
+
+    With stats (a PassRateStats), every condition, term and filter counts how often
+    it passes. With optimize=True, sibling terms are reordered by estimated cost and
+    by the pass rates in stats, so cheap decisive checks short-circuit expensive
+    aggregations and nested entity walks. With profile (a RuleProfile), every node
+    also records its wall time. With reoptimize_every=N, the rule collects stats
+    (a new PassRateStats unless given) and reorders itself from them every N
+    evaluations; see AdaptiveRule.
+    """
+    if reoptimize_every is not None:
+        return AdaptiveRule(rule, reoptimize_every, stats, profile)
+    ctx = _CompileContext(stats, optimize, profile=profile)
+    predicate = _compile_conditions(rule, ctx)
+    if profile is not None:
+        predicate = _timed(predicate, profile.node(""))
+    return CompiledRule(rule, predicate, list(ctx.slots))
+
+class AdaptiveRule(CompiledRule):
+    """A CompiledRule that reorders its terms from its own pass rates as it runs.
+
+    It is compiled with stats and optimize=True, and recompiled from the stats
+    gathered so far every reoptimize_every evaluations, so the order follows the
+    data of a long run. Slots are allocated in rule order, so the recompiled plan
+    binds variables the same way and is swapped in with one assignment.
+    Instrumented plans skip the NumPy aggregate path.
+    """
+
+    def __init__(self, rule, reoptimize_every, stats=None, profile=None):
+        if reoptimize_every < 1:
+            raise ValueError(f"reoptimize_every must be at least 1, got {reoptimize_every}")
+        self.stats = stats if stats is not None else PassRateStats()
+        self.profile = profile
+        self.reoptimize_every = reoptimize_every
+        self.countdown = reoptimize_every
+        self.reoptimizations = 0
+        plan = compile_rule(rule, self.stats, optimize=True, profile=profile)
+        super().__init__(rule, plan.predicate, plan.variable_names)
+
+    def evaluate(self, data, variables):
+        self.countdown -= 1
+        if self.countdown <= 0:
+            self.reoptimize()
+        return self.predicate(data, [data], self.bind(variables))
+
+    def reoptimize(self):
+        """Recompile with the current stats, e.g. after the workload changed."""
+        self.countdown = self.reoptimize_every
+        self.predicate = compile_rule(self.rule, self.stats, optimize=True, profile=self.profile).predicate
+        self.reoptimizations += 1
+
+class RuleSet:
+    """Many rules compiled into one network that shares identical filters and terms.
+
+    Structurally identical filters, entity row selections, terms and conditions
+    are evaluated once per input, and their results are reused by every rule that
+    contains them. With reoptimize_every=N the network collects stats and is
+    recompiled with optimize=True from them every N evaluations, like AdaptiveRule.
+    """
+
+    def __init__(self, rules, optimize=False, stats=None, reoptimize_every=None):
+        """rules is a dict of rule_id -> rule dict, or a list of rules identified by name."""
+        if not isinstance(rules, dict):
+            rules = {get_rule_name(rule): rule for rule in rules}
+        if reoptimize_every is not None:
+            if reoptimize_every < 1:
+                raise ValueError(f"reoptimize_every must be at least 1, got {reoptimize_every}")
+            optimize = True
+            stats = stats if stats is not None else PassRateStats()
+        self.rules = rules
+        self.optimize = optimize
+        self.stats = stats
+        self.reoptimize_every = reoptimize_every
+        self.countdown = reoptimize_every
+        self.reoptimizations = 0
+        self._compile()
+
+    def _compile(self):
+        ctx = _CompileContext(self.stats, self.optimize, share=True)
+        self.predicates = {rule_id: _compile_conditions(rule, ctx) for rule_id, rule in self.rules.items()}
+        self.variable_names = list(ctx.slots)
+        self.shared_nodes = len(ctx.node_ids)
+
+    def reoptimize(self):
+        """Recompile the network with optimize=True from the stats collected so far."""
+        self.countdown = self.reoptimize_every
+        self._compile()
+        self.reoptimizations += 1
+
+    bind = CompiledRule.bind
+
+    def evaluate(self, data, variables):
+        """Evaluate every rule against one payload. Returns {rule_id: result}."""
+        if self.reoptimize_every is not None:
+            self.countdown -= 1
+            if self.countdown <= 0:
+                self.reoptimize()
+        bound = self.bind(variables)
+        rows = [data]
+        return {rule_id: predicate(data, rows, bound) for rule_id, predicate in self.predicates.items()}
+
+# Plans compiled by evaluate_rule: (ruleName, ruleVersion, lastUpdated) or id(rule dict) -> (rule dict, CompiledRule)
+EVALUATE_CACHE_SIZE = 128  # Rule dicts whose plans evaluate_rule keeps
+_compiled_rules = {}
+
+def _plan_key(rule):
+    """(ruleName, ruleVersion, lastUpdated) of a versioned rule dict, None when it carries neither stamp."""
+    metadata = rule.get("metadata", {})
+    version = metadata.get("ruleVersion", rule.get("version"))
+    updated = metadata.get("lastUpdated", metadata.get("last_updated", rule.get("last_updated")))
+    if version is None and updated is None:
+        return None
+    return (get_rule_name(rule), version, updated)
+
+def compiled_plan(rule):
+    """The CompiledRule for a rule dict, compiled on first use and reused afterwards.
+
+    Versioned rules share a plan per (ruleName, ruleVersion, lastUpdated), so a copy
+    parsed again reuses it and an in-place edit that bumps either stamp recompiles.
+    Rules without stamps are matched by identity; edit those in place only through
+    compile_rule. Compiled rules are returned as they are.
+    """
+    if isinstance(rule, CompiledRule):
+        return rule
+    key = _plan_key(rule)
+    if key is None:
+        key = id(rule)
+    entry = _compiled_rules.get(key)
+    if entry is None or (type(key) is int and entry[0] is not rule):  # Holding the dict keeps its id from being reused
+        if len(_compiled_rules) >= EVALUATE_CACHE_SIZE:
+            _compiled_rules.pop(next(iter(_compiled_rules)), None)
+        entry = _compiled_rules[key] = (rule, compile_rule(rule))
+    return entry[1]
+
+def evaluate_rule(rule, data, variables):
+    """Evaluate a rule dict (or an already compiled rule) against one data payload.
+
+    The plan comes from compiled_plan, so a dict is only compiled on its first evaluation.
+    """
+    return compiled_plan(rule).evaluate(data, variables)
+
+if __name__ == "__main__":
+    from rule_validation import parse_rule
+
+    # Load and validate the rule
+    rule = parse_rule(rule_json)
+
+    # Evaluate the rule
+    result = evaluate_rule(rule, data, variables)
 
-    def evaluate_expression(expr, data):
-        if expr["language"] == "juel":
-            expression = expr["expression"][2:-1]  # Remove ${} from JUEL expression
-            return parser.parse(expression).evaluate(create_juel_context(data))
-
-    def create_juel_context(data):
-        # Create a JUEL context with data
-        context = SimpleContext()
-        for key, value in data.items():
-            context.setVariable(key, expressionFactory.createValueExpression(value, Object.class))
-        return context
-
-    results = [evaluate_condition(condition, data) for condition in conditions]
-    return all(results)  # Assuming overall "and" condition
-
-# Load the rule from JSON
-rule = json.loads(rule_json)
-
-# Evaluate the rule
-result = evaluate_rule(rule, data, variables)
-
-# Print the result
-if result:
-    print("Rule evaluated to TRUE")
-    # You can add logic here to perform the action specified in the metadata
-else:
-    print("Rule evaluated to FALSE")
\ No newline at end of file
+    # Print the result
+    if result:
+        print("Rule evaluated to TRUE")
+        # You can add logic here to perform the action specified in the metadata
+    else:
+        print("Rule evaluated to FALSE")
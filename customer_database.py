@@ -0,0 +1,111 @@
+import logging
+import random
+import uuid
+import pandas as pd
+from sqlalchemy import text
+from database_engine import get_engine
+from customer_sampling import SAMPLING_METHODS, StreamingSampler
+from result_sink import ResultSink
+
+CHUNK_SIZE = 10000  # Customers fetched per round trip when streaming
+
+class Database:
+    def __init__(self, num_samples=5, customers_per_sample=10, sampling_method="random", data_percentage=1,
+                 seed=None, table_sample="SYSTEM", engine=None, strata_column=None):
+        self.engine = engine or get_engine()  # Shared by every request; one pool per process
+        self.num_samples = num_samples
+        self.customers_per_sample = customers_per_sample
+        self.sampling_method = sampling_method  # Options: "random", "stratified", "systematic"
+        self.data_percentage = data_percentage  # Percentage of the data to retrieve (1% or 2%)
+        self.seed = seed  # Makes the database-side sample repeatable
+        if table_sample not in ("SYSTEM", "BERNOULLI"):
+            raise ValueError(f"Unknown TABLESAMPLE method: {table_sample}")
+        self.table_sample = table_sample  # SYSTEM samples whole pages, BERNOULLI individual rows
+        if strata_column is not None and not strata_column.isidentifier():
+            raise ValueError(f"Invalid strata column: {strata_column}")
+        self.strata_column = strata_column  # customers column that stratified sampling groups by
+    
+    def _customers_query(self, include_only_active, columns):
+        """SELECT over a data_percentage sample of customers, sampled inside the database.
+        
+        Postgres uses TABLESAMPLE, REPEATABLE when a seed is set. Other databases keep
+        the rows whose hashed id falls within the percentage, repeatable for the same
+        seed. Neither sorts the table or counts it, and the percentage applies to the
+        customers left after the is_active filter. At 100% every customer is read.
+        """
+        percentage = float(max(1, min(self.data_percentage, 100)))  # Ensure valid percentage range
+        conditions = ["is_active = TRUE"] if include_only_active else []
+        source = "customers"
+        if percentage < 100 and self.engine.dialect.name == "postgresql":
+            repeatable = f" REPEATABLE ({float(self.seed)})" if self.seed is not None else ""
+            source = f"customers TABLESAMPLE {self.table_sample} ({percentage}){repeatable}"
+        elif percentage < 100:
+            seed = int(self.seed) if self.seed is not None else random.randrange(2 ** 31)
+            conditions.append(f"((id * 2654435761 + {seed}) % 4294967296) % 1000000 < {int(percentage * 10000)}")
+        query = f"SELECT {', '.join(columns)} FROM {source}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return text(query)
+    
+    def estimated_rows(self, query):
+        """Rows a query will return: the planner's estimate on Postgres (no scan), COUNT(*) elsewhere."""
+        with self.engine.connect() as connection:
+            if self.engine.dialect.name == "postgresql":
+                plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+                return int(plan[0]["Plan"]["Plan Rows"])
+            return connection.execute(text(f"SELECT COUNT(*) FROM ({query}) AS population")).scalar()
+    
+    def _columns(self):
+        return ["id", "name"] + ([self.strata_column] if self.strata_column else [])
+    
+    def get_customers(self, include_only_active=True):
+        """Fetch a data_percentage sample of customers as a DataFrame."""
+        df = pd.read_sql(self._customers_query(include_only_active, self._columns()), con=self.engine)
+        logging.info(f"Sampled {len(df)} customers")
+        return df
+    
+    def stream_customers(self, include_only_active=True, chunk_size=CHUNK_SIZE, query=None):
+        """Yield the customers of get_customers in chunks of dicts through a server-side cursor."""
+        query = query if query is not None else self._customers_query(include_only_active, self._columns())
+        with self.engine.connect() as connection:
+            connection = connection.execution_options(stream_results=True, max_row_buffer=chunk_size)
+            result = connection.execute(query)
+            for rows in result.mappings().partitions(chunk_size):
+                yield [dict(row) for row in rows]
+    
+    def _sampler(self, population, strata_column):
+        method = self.sampling_method
+        if method not in SAMPLING_METHODS:
+            logging.warning("Unknown sampling method, defaulting to random sampling.")
+            method = "random"
+        # Without a stratum column every customer falls in one stratum
+        strata_key = (lambda row: row.get(strata_column)) if strata_column else None
+        return StreamingSampler(method, self.num_samples, self.customers_per_sample, population, strata_key, self.seed)
+    
+    def sample_customers(self, include_only_active=True, chunk_size=CHUNK_SIZE):
+        """Draw every sample in one streaming pass, holding only num_samples x customers_per_sample rows.
+        
+        Systematic sampling spaces its picks by the estimated size of the filtered
+        population, so on Postgres the interval is only as exact as the planner's estimate.
+        """
+        query = self._customers_query(include_only_active, self._columns())
+        population = self.estimated_rows(query) if self.sampling_method == "systematic" else None
+        sampler = self._sampler(population, self.strata_column)
+        for rows in self.stream_customers(include_only_active, chunk_size, query):
+            sampler.add(rows)
+        return [pd.DataFrame(sample, columns=self._columns()) for sample in sampler.samples() if sample]
+    
+    def select_samples(self, customers_df):
+        """Select samples from an already loaded DataFrame, in one pass over its rows"""
+        if customers_df.empty:
+            return []
+        strata_column = self.strata_column or ("group" if "group" in customers_df.columns else None)
+        sampler = self._sampler(len(customers_df), strata_column)
+        sampler.add(customers_df.to_dict(orient="records"))
+        return [pd.DataFrame(sample, columns=customers_df.columns) for sample in sampler.samples()]
+    
+    def store_results(self, results_data, run_id=None, caller=None, sample=None):
+        """Store rule engine results and their run, rule and sample aggregations in one pass"""
+        with ResultSink(self.engine, run_id or uuid.uuid4().hex, caller) as sink:
+            sink.add(results_data, sample)
+        return sink.aggregates()
@@ -0,0 +1,98 @@
+import math
+import random
+
+SAMPLING_METHODS = ("random", "stratified", "systematic")
+
+class Reservoir:
+    """Uniform random sample of up to `size` items from a stream of unknown length.
+
+    Uses Algorithm L: after the reservoir fills, it draws how many items to skip
+    before the next replacement, so most items cost one comparison and no random draw.
+    """
+
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.items = []
+        self.seen = 0
+        self.weight = 1.0
+        self.next_index = size - 1  # Stream index of the next item that goes in
+
+    def _skip(self):
+        self.weight *= math.exp(math.log(1 - self.rng.random()) / self.size)
+        self.next_index += int(math.log(1 - self.rng.random()) / math.log(1 - self.weight)) + 1 \
+            if self.weight < 1 else 1
+
+    def add(self, item):
+        if self.size <= 0:
+            return
+        if self.seen < self.size:
+            self.items.append(item)
+            if self.seen + 1 == self.size:
+                self._skip()
+        elif self.seen == self.next_index:
+            self.items[self.rng.randrange(self.size)] = item
+            self._skip()
+        self.seen += 1
+
+class StreamingSampler:
+    """Draws num_samples samples of sample_size rows each from one pass over a row stream.
+
+    random keeps one independent reservoir per sample; stratified keeps one per
+    sample per stratum (strata_key picks a row's stratum), taking up to sample_size
+    rows from every stratum; systematic takes every k-th row from a random start per
+    sample, with k worked out from the (estimated) population size. Memory holds only
+    the samples, never the stream.
+    """
+
+    def __init__(self, method, num_samples, sample_size, population=None, strata_key=None, seed=None):
+        if method not in SAMPLING_METHODS:
+            raise ValueError(f"Unknown sampling method: {method}")
+        self.method = method
+        self.num_samples = num_samples
+        self.sample_size = sample_size
+        self.strata_key = strata_key or (lambda row: "default")
+        self.rng = random.Random(seed)
+        if method == "random":
+            self.reservoirs = [Reservoir(sample_size, self.rng) for _ in range(num_samples)]
+        elif method == "stratified":
+            self.strata = {}  # stratum -> one reservoir per sample
+        else:
+            if population is None:
+                raise ValueError("Systematic sampling needs the population size")
+            self.interval = max(1, population // max(1, sample_size))
+            self.starts = [self.rng.randrange(self.interval) for _ in range(num_samples)]
+            self.systematic = [[] for _ in range(num_samples)]
+            self.position = 0
+
+    def add(self, rows):
+        """Feed the next chunk of rows."""
+        if self.method == "random":
+            for row in rows:
+                for reservoir in self.reservoirs:
+                    reservoir.add(row)
+        elif self.method == "stratified":
+            for row in rows:
+                stratum = self.strata_key(row)
+                reservoirs = self.strata.get(stratum)
+                if reservoirs is None:
+                    reservoirs = self.strata[stratum] = [Reservoir(self.sample_size, self.rng)
+                                                         for _ in range(self.num_samples)]
+                for reservoir in reservoirs:
+                    reservoir.add(row)
+        else:
+            for row in rows:
+                for start, sample in zip(self.starts, self.systematic):
+                    offset = self.position - start
+                    if offset >= 0 and offset % self.interval == 0 and len(sample) < self.sample_size:
+                        sample.append(row)
+                self.position += 1
+
+    def samples(self):
+        """The num_samples samples, each a list of rows."""
+        if self.method == "random":
+            return [reservoir.items for reservoir in self.reservoirs]
+        if self.method == "stratified":
+            return [[row for reservoirs in self.strata.values() for row in reservoirs[i].items]
+                    for i in range(self.num_samples)]
+        return self.systematic
@@ -84,6 +84,7 @@ def parse_entity_attributes(ast, df_entities):
                         "DataSource": data_source,
                         "EntityName": parent_entity,
                         "AttributeName": attribute_name,
+                        "AttributeType": attribute_type,
                         "ParentAttributeName": None,
                         "Source": "GraphQL",
                         "RateLimit": None,
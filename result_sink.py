@@ -0,0 +1,165 @@
+import csv
+import io
+import logging
+import threading
+import weakref
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect
+
+metadata = MetaData()
+
+results_table = Table(
+    "results", metadata,
+    Column("run_id", String(32), index=True),
+    Column("caller", String(255)),
+    Column("sample", Integer),
+    Column("customer_id", String(64)),
+    Column("rule_id", String(255)),
+    Column("rule_engine_result", String(64)),
+    Column("created_at", DateTime, server_default=func.now()),
+)
+
+# One row per run, per rule and per sample (scope says which; the other key is NULL)
+aggregation_table = Table(
+    "results_aggregation", metadata,
+    Column("run_id", String(32), index=True),
+    Column("caller", String(255)),
+    Column("scope", String(16)),
+    Column("rule_id", String(255)),
+    Column("sample", Integer),
+    Column("timestamp", DateTime),
+    Column("number_of_samples", Integer),
+    Column("number_of_customers", Integer),
+    Column("total_success", Integer),
+    Column("total_failure", Integer),
+    Column("total_error", Integer),
+)
+
+RESULT_COLUMNS = ["run_id", "caller", "sample", "customer_id", "rule_id", "rule_engine_result"]
+SINK_BATCH_SIZE = 5000  # Rows buffered before they are written
+
+# rule_engine_result values counted into each total
+OUTCOMES = {"Success": "total_success", "Failure": "total_failure", "API_ERROR": "total_error"}
+
+# Engines whose results tables are known to exist, so each run skips the check
+_tables_created = weakref.WeakSet()
+_tables_lock = threading.Lock()  # Concurrent runs would otherwise race to CREATE / ALTER TABLE
+
+def migrate_tables(engine):
+    """Create the results tables, or bring tables from before run_id/caller/sample/scope up to date.
+
+    Earlier versions created results and results_aggregation with pandas to_sql,
+    without the run and scope columns. Missing columns are added (NULL for old
+    rows) and the run_id indexes created, so existing deployments keep working.
+    """
+    tables = [results_table, aggregation_table]
+    metadata.create_all(engine, tables=tables)
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                default = " DEFAULT CURRENT_TIMESTAMP" if column.server_default is not None and \
+                    engine.dialect.name != "sqlite" else ""  # SQLite can't add a column with a non-constant default
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}")
+                logging.info(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+class ResultSink:
+    """Writes rule engine results as they arrive and aggregates them in the same pass.
+
+    Rows are buffered up to batch_size and then written with COPY on Postgres
+    (psycopg2), or one executemany INSERT elsewhere. Success/failure/error counters
+    are kept per rule and per sample while rows stream through; close() writes the
+    run, rule and sample aggregation rows for run_id.
+    """
+
+    def __init__(self, engine, run_id, caller=None, batch_size=SINK_BATCH_SIZE):
+        self.engine = engine
+        self.run_id = run_id
+        self.caller = caller
+        self.batch_size = batch_size
+        self.buffer = []
+        self.counts = Counter()  # (rule_id, sample, rule_engine_result) -> rows
+        self.samples = set()
+        self.use_copy = engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+        with _tables_lock:
+            if engine not in _tables_created:
+                migrate_tables(engine)
+                _tables_created.add(engine)
+
+    def add(self, results, sample=None):
+        """Take result dicts (customer_id, rule_id, rule_engine_result) belonging to one sample."""
+        self.samples.add(sample)
+        for result in results:
+            rule_id = result.get("rule_id")
+            outcome = result.get("rule_engine_result")
+            self.counts[(rule_id, sample, outcome)] += 1
+            self.buffer.append((self.run_id, self.caller, sample, result.get("customer_id"), rule_id, outcome))
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        rows, self.buffer = self.buffer, []
+        with self.engine.begin() as connection:
+            if self.use_copy:
+                self._copy(connection, rows)
+            else:
+                connection.execute(results_table.insert(), [dict(zip(RESULT_COLUMNS, row)) for row in rows])
+
+    def _copy(self, connection, rows):
+        data = io.StringIO()
+        csv.writer(data, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)  # None is written unquoted, i.e. NULL
+        data.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY results ({', '.join(RESULT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", data)
+        finally:
+            cursor.close()
+
+    def aggregates(self):
+        """Aggregation rows for the run as a whole, each rule and each sample.
+
+        Safe to call from another thread while add() runs, e.g. to report partial aggregates.
+        """
+        groups = {}
+        for (rule_id, sample, outcome), count in list(self.counts.items()):
+            for key in (("run", None, None), ("rule", rule_id, None), ("sample", None, sample)):
+                totals = groups.setdefault(key, Counter())
+                totals["number_of_customers"] += count
+                if outcome in OUTCOMES:
+                    totals[OUTCOMES[outcome]] += count
+        timestamp = datetime.now()
+        rows = []
+        for (scope, rule_id, sample), totals in groups.items():
+            row = {"run_id": self.run_id, "caller": self.caller, "scope": scope, "rule_id": rule_id,
+                   "sample": sample, "timestamp": timestamp, "number_of_samples": len(self.samples)}
+            row.update({column: totals[column] for column in ["number_of_customers", *OUTCOMES.values()]})
+            rows.append(row)
+        return rows
+
+    def close(self):
+        """Write what is still buffered plus the aggregation rows; returns the aggregation rows."""
+        self.flush()
+        rows = self.aggregates()
+        if rows:
+            with self.engine.begin() as connection:
+                connection.execute(aggregation_table.insert(), rows)
+        logging.info(f"Results and aggregation stored for run {self.run_id}.")
+        return rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.flush()  # Keep the results that did arrive; a failed run gets no aggregates
@@ -0,0 +1,242 @@
+import numpy as np
+from Rule import AGGREGATES, parse_expression, vector_compare
+
+# Column that ties a row of a list-valued entity (account, audienceSegments, ...)
+# to the position of the record it belongs to in the batch.
+RECORD_INDEX = "_record"
+
+def _columns(table):
+    """Turn a pandas DataFrame or a dict of sequences into a dict of NumPy arrays."""
+    if hasattr(table, "columns"):
+        return {column: table[column].to_numpy() for column in table.columns}
+    return {column: np.asarray(values) for column, values in table.items()}
+
+def _missing(values):
+    """Mask of None/NaN entries."""
+    values = np.asarray(values, dtype=object)
+    return np.equal(values, None) | np.not_equal(values, values)
+
+class _Frame:
+    """Rows currently being evaluated: one per record, or the rows of a list entity."""
+
+    def __init__(self, columns, size, owner=None, mask=None, tables=None, prefix=""):
+        self.columns = columns
+        self.size = size
+        self.owner = owner  # record position of each row, None when rows are records
+        self.mask = mask  # rows that passed the entity filters
+        self.tables = tables  # every table of the batch, for dotted fields such as "customer.age"
+        self.prefix = prefix  # entity path of these rows plus ".", "" at the root
+
+    def column(self, field):
+        values = self.columns.get(field)
+        if values is None and "." in field and self.tables is not None:
+            values = self._nested_column(field)
+        if values is None:
+            return np.full(self.size, None, dtype=object)
+        return values
+
+    def _nested_column(self, field):
+        """Column of a dotted field read through a nested entity's table, e.g. customer.age at the root."""
+        parts = field.split(".")
+        for split in range(len(parts) - 1, 0, -1):  # Longest entity path first
+            path = self.prefix + ".".join(parts[:split])
+            table = self.tables.get(path)
+            if table is None:
+                continue
+            if self.owner is not None or RECORD_INDEX in table:
+                raise ValueError(f"Field '{self.prefix}{field}' reads list entity rows and cannot be evaluated in batch mode")
+            return table.get(".".join(parts[split:]))
+        return None
+
+    def per_row(self, values):
+        """Broadcast a per-record array onto this frame's rows."""
+        if np.ndim(values) == 0 or self.owner is None:
+            return values
+        return np.asarray(values)[self.owner]
+
+class _Batch:
+    def __init__(self, tables, variables, size):
+        self.tables = tables
+        self.variables = variables
+        self.size = size
+
+def _compile_value(value):
+    """Compile a literal, $variable or JUEL expression into fn(frame, batch) -> scalar or column."""
+    if isinstance(value, dict) and "expr" in value:
+        parsed = parse_expression(value["expr"]["expression"])
+        names = parsed.variables()
+        if not names:
+            constant = parsed.evaluate({})
+            return lambda frame, batch: constant
+
+        def evaluate_expression(frame, batch):
+            columns = {name: np.broadcast_to(batch.variables.get(name), batch.size) for name in names}
+            values = np.array([parsed.evaluate({name: columns[name][i] for name in names})
+                               for i in range(batch.size)])
+            return frame.per_row(values)
+        return evaluate_expression
+    if isinstance(value, str) and value.startswith("$"):
+        name = value[1:]
+        return lambda frame, batch: frame.per_row(batch.variables.get(name))
+    return lambda frame, batch: value
+
+def _compile_filter(filter):
+    """Compile a filter into fn(frame, batch) -> row mask."""
+    field = filter["field"]
+    comp = filter["operator"]
+    get_value = _compile_value(filter["value"])
+    optional = filter.get("optional", False)
+
+    def evaluate_filter(frame, batch):
+        expected = get_value(frame, batch)
+        mask = vector_compare(comp, frame.column(field), expected)
+        if optional:
+            if np.ndim(expected) == 0:
+                return np.ones(frame.size, dtype=bool) if expected is None else mask
+            mask = mask | _missing(expected)
+        return mask
+    return evaluate_filter
+
+def _compile_filters(filters):
+    compiled = [_compile_filter(filter) for filter in filters or []]
+
+    def apply_filters(frame, batch):
+        mask = np.ones(frame.size, dtype=bool)
+        for evaluate_filter in compiled:
+            mask &= evaluate_filter(frame, batch)
+        return mask
+    return apply_filters
+
+def _compile_term(term):
+    field = term["field"]
+    func = term["function"]
+    comp = term["operator"]
+    get_value = _compile_value(term["value"])
+
+    if func == "comp":
+        return lambda frame, batch: vector_compare(comp, frame.column(field), get_value(frame, batch))
+    if func in AGGREGATES:
+        apply_filters = _compile_filters(term.get("filters"))
+
+        def evaluate_aggregate(frame, batch):
+            mask = apply_filters(frame, batch)
+            if frame.mask is not None:
+                mask &= frame.mask
+            values = frame.column(field)
+            mask &= ~_missing(values)
+            owner = frame.owner if frame.owner is not None else np.arange(frame.size)
+            results = _aggregate_by_record(func, owner[mask], values[mask], batch.size)
+            expected = get_value(_Frame({}, batch.size), batch)
+            return frame.per_row(vector_compare(comp, results, expected))
+        return evaluate_aggregate
+    raise ValueError(f"Unsupported term function: {func}")
+
+def _aggregate_by_record(func, owner, values, size):
+    """Aggregate values grouped by the record that owns them; records without values get None/0."""
+    counts = np.bincount(owner, minlength=size)
+    if func == "count":
+        return counts
+    if func == "distinct_count":
+        distinct = set(zip(owner.tolist(), values.tolist()))
+        return np.bincount(np.array([record for record, _ in distinct], dtype=int), minlength=size)
+    if func in ("sum", "avg"):
+        totals = np.bincount(owner, weights=values.astype(float), minlength=size)
+        if func == "sum":
+            return totals
+        results = np.full(size, None, dtype=object)
+        present = counts > 0
+        results[present] = totals[present] / counts[present]
+        return results
+    reduce = np.minimum if func == "min" else np.maximum
+    extreme = np.full(size, np.inf if func == "min" else -np.inf)
+    reduce.at(extreme, owner, values.astype(float))
+    results = np.full(size, None, dtype=object)
+    present = counts > 0
+    results[present] = extreme[present]
+    return results
+
+def _combine(op, children):
+    if op not in ("and", "or"):
+        raise ValueError(f"Unsupported op: {op}")
+    combine = np.logical_and if op == "and" else np.logical_or
+
+    def evaluate_group(frame, batch):
+        mask = children[0](frame, batch)
+        for child in children[1:]:
+            mask = combine(mask, child(frame, batch))
+        return mask
+    return evaluate_group
+
+def _compile_entity(node, prefix):
+    path = prefix + node["entity"]
+    apply_filters = _compile_filters(node.get("filters"))
+    terms = [_compile_node(term, path + ".") for term in node.get("terms", [])]
+    body = _combine(node.get("op", "and"), terms) if terms else None
+
+    def evaluate_entity(frame, batch):
+        if frame.owner is not None:
+            raise ValueError(f"Entity '{path}' nested under a list entity cannot be evaluated in batch mode")
+        table = batch.tables.get(path)
+        if table is None:
+            return np.zeros(frame.size, dtype=bool)
+        owner = table.get(RECORD_INDEX)
+        size = len(owner) if owner is not None else batch.size
+        entity = _Frame(table, size, owner, tables=batch.tables, prefix=path + ".")
+        entity.mask = apply_filters(entity, batch)
+        mask = entity.mask if body is None else entity.mask & body(entity, batch)
+        if owner is None:
+            return mask
+        return np.bincount(owner[mask], minlength=batch.size) > 0
+    return evaluate_entity
+
+def _compile_node(node, prefix=""):
+    if "entity" in node:
+        return _compile_entity(node, prefix)
+    if "op" in node:
+        return _combine(node["op"], [_compile_node(term, prefix) for term in node["terms"]])
+    return _compile_term(node)
+
+class CompiledBatchRule:
+    """A rule compiled into vectorized closures over columnar entity tables."""
+
+    def __init__(self, rule, predicate):
+        self.rule = rule
+        self.predicate = predicate
+
+    def evaluate(self, records, variables=None):
+        variables = variables or {}
+        tables = {path: _columns(table) for path, table in records.items()}
+        size = _batch_size(tables, variables)
+        batch = _Batch(tables, variables, size)
+        return self.predicate(_Frame({}, size, tables=tables), batch)
+
+def _batch_size(tables, variables):
+    """Number of records in the batch, taken from record-level tables and variable columns."""
+    sizes = set()
+    for columns in tables.values():
+        if RECORD_INDEX not in columns and columns:
+            sizes.add(len(next(iter(columns.values()))))
+    sizes.update(len(values) for values in variables.values() if np.ndim(values) == 1)
+    if len(sizes) > 1:
+        raise ValueError(f"Inconsistent batch sizes: {sorted(sizes)}")
+    if sizes:
+        return sizes.pop()
+    owners = [columns[RECORD_INDEX] for columns in tables.values() if len(columns.get(RECORD_INDEX, ()))]
+    return max(int(owner.max()) for owner in owners) + 1 if owners else 0
+
+def compile_rule_batch(rule):
+    """Compile a rule dict for columnar evaluation."""
+    conditions = [_compile_node(condition) for condition in rule["conditions"]]
+    return CompiledBatchRule(rule, _combine("and", conditions))  # Assuming overall "and" condition
+
+def evaluate_rule_batch(rule, records, variables=None):
+    """Evaluate a rule over a columnar batch and return one boolean per record.
+
+    records maps an entity path ("customer", "account", "branch.suppliers") to a
+    DataFrame or dict of arrays. Entities with one row per record are aligned by
+    position; list-valued entities carry a RECORD_INDEX column pointing at the
+    record each row belongs to. variables values may be scalars or per-record arrays.
+    """
+    if not isinstance(rule, CompiledBatchRule):
+        rule = compile_rule_batch(rule)
+    return rule.evaluate(records, variables)
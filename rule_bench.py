@@ -0,0 +1,232 @@
+import argparse
+import json
+import platform
+import random
+import time
+import tracemalloc
+from datetime import datetime
+from Rule import compile_rule, evaluate_rule, rule_json
+
+BENCHMARK_FORMAT_VERSION = 1
+
+def make_payload(rng, customer_id, accounts=5, segments=3, suppliers=2):
+    """Synthetic GraphQL-style data payload for one customer."""
+    return {
+        "customer": {
+            "customer_id": customer_id,
+            "age": rng.randint(18, 110),
+            "status": rng.choice(["active", "inactive", "pending"]),
+            "active_days": rng.randint(0, 1000),
+        },
+        "account": [
+            {
+                "customer_id": customer_id,
+                "account_number": f"ACC{customer_id}-{i}",
+                "account_type": rng.choice(["SB", "CA", "FD"]),
+                "balance": rng.choice([500, 1500, 5000, 10000, 20000]),
+                "flag": rng.choice(["open", "closed"]),
+            }
+            for i in range(accounts)
+        ],
+        "audienceSegments": [
+            {"customer_id": customer_id, "flow_id": rng.choice([30, 31]), "var_id": rng.choice([40, 45, 50])}
+            for _ in range(segments)
+        ],
+        "orders": [
+            {"customer_id": customer_id, "status": rng.choice(["pending", "shipped"])}
+            for _ in range(max(1, accounts // 2))
+        ],
+        "branch": {
+            "branch_id": f"BR{customer_id % 10}",
+            "location": rng.choice(["Bengaluru", "Mumbai"]),
+            "suppliers": [
+                {"supplier_type": rng.choice(["Gold", "Silver"]), "supplier_status": rng.choice(["approved", "pending"])}
+                for _ in range(suppliers)
+            ],
+        },
+        "calendar": {"day_of_week": rng.choice(["Friday", "Monday"])},
+    }
+
+def make_variables(customer_id, payload):
+    return {
+        "customerId": customer_id,
+        "customerStatus": "active",
+        "branchId": payload["branch"]["branch_id"],
+        "accountNumber": f"ACC{customer_id}-0",
+    }
+
+def _comp(field, operator, value, type="string"):
+    return {"field": field, "type": type, "function": "comp", "operator": operator, "value": value}
+
+def v3_rule():
+    """The embedded demo rule from Rule.py."""
+    return json.loads(rule_json)
+
+def v6_rule():
+    """The ruleDefinition of v6.json, restricted to the grammar and operators the evaluator supports."""
+    customer_filters = [_comp("customer_id", "equals", "$customerId"), _comp("status", "equals", "$customerStatus")]
+    return {
+        "metadata": {"ruleName": "CustomerEligibilityRule_v6_shape"},
+        "conditions": [
+            {
+                "op": "or",
+                "terms": [
+                    {"entity": "customer", "filters": customer_filters, "op": "and", "terms": []},
+                    {"op": "and", "terms": [_comp("customer.age", "gte", 18, "integer"),
+                                            _comp("customer.active_days", "gt", 30, "integer")]},
+                ],
+            },
+            {"entity": "orders", "filters": [_comp("customer_id", "equals", "$customerId"),
+                                             _comp("status", "equals", "pending")], "op": "and", "terms": []},
+            {
+                "entity": "account",
+                "filters": [_comp("customer_id", "equals", "$customerId")],
+                "op": "and",
+                "terms": [
+                    _comp("account_type", "equals", "SB"),
+                    _comp("balance", "gt", 1000, "number"),
+                    {"field": "balance", "type": "number", "function": "sum", "operator": "gt", "value": 20000,
+                     "filters": [_comp("flag", "equals", "open")]},
+                ],
+            },
+            {
+                "entity": "audienceSegments",
+                "filters": [_comp("customer_id", "equals", "$customerId")],
+                "op": "or",
+                "terms": [
+                    {"op": "and", "terms": [_comp("flow_id", "equals", 30, "integer"), _comp("var_id", "equals", 40, "integer")]},
+                    {"op": "and", "terms": [_comp("flow_id", "equals", 30, "integer"), _comp("var_id", "equals", 45, "integer")]},
+                ],
+            },
+        ],
+    }
+
+def synthetic_rule(rng, depth=3, width=3):
+    """A rule of nested and/or groups, `depth` levels deep with `width` terms per group."""
+    leaves = [
+        lambda: _comp("age", rng.choice(["gt", "lt"]), rng.randint(18, 110), "integer"),
+        lambda: _comp("status", "equals", rng.choice(["active", "inactive"])),
+        lambda: _comp("active_days", "gte", rng.randint(0, 1000), "integer"),
+    ]
+
+    def group(level):
+        op = "and" if level % 2 == 0 else "or"
+        if level == depth:
+            return {"op": op, "terms": [rng.choice(leaves)() for _ in range(width)]}
+        return {"op": op, "terms": [group(level + 1) for _ in range(width)]}
+
+    return {
+        "metadata": {"ruleName": f"Synthetic_d{depth}_w{width}"},
+        "conditions": [
+            {"entity": "customer", "filters": [_comp("customer_id", "equals", "$customerId")], **group(1)},
+            {"entity": "account", "filters": [_comp("customer_id", "equals", "$customerId")], "op": "and",
+             "terms": [{"field": "balance", "type": "number", "function": "sum", "operator": "gt",
+                        "value": 1000 * width, "filters": [_comp("flag", "equals", "open")]}]},
+        ],
+    }
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def run_case(name, evaluate, inputs, alloc_samples=200):
+    """Time evaluate(data, variables) over every input and measure allocation per evaluation."""
+    timings = []
+    passed = 0
+    for data, variables in inputs:
+        start = time.perf_counter_ns()
+        passed += bool(evaluate(data, variables))
+        timings.append(time.perf_counter_ns() - start)
+
+    tracemalloc.start()
+    allocated = []
+    for data, variables in inputs[:alloc_samples]:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        evaluate(data, variables)
+        allocated.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "case": name,
+        "evaluations": len(timings),
+        "pass_rate": passed / len(timings),
+        "evals_per_sec": len(timings) / (sum(timings) / 1e9),
+        "p50_us": _percentile(timings, 0.50) / 1000,
+        "p99_us": _percentile(timings, 0.99) / 1000,
+        "peak_alloc_bytes_per_eval": sum(allocated) / len(allocated),
+    }
+
+def run_benchmark(customers=1000, accounts=5, segments=3, suppliers=2, depth=3, width=3,
+                  shapes=("v3", "v6", "synthetic"), seed=42):
+    rng = random.Random(seed)
+    inputs = []
+    for customer_id in range(customers):
+        payload = make_payload(rng, customer_id, accounts, segments, suppliers)
+        inputs.append((payload, make_variables(customer_id, payload)))
+
+    rules = {"v3": v3_rule, "v6": v6_rule, "synthetic": lambda: synthetic_rule(rng, depth, width)}
+    results = []
+    for shape in shapes:
+        rule = rules[shape]()
+        compiled = compile_rule(rule)
+        optimized = compile_rule(rule, optimize=True)
+        results.append(run_case(f"{shape}/compiled", compiled.evaluate, inputs))
+        results.append(run_case(f"{shape}/optimized", optimized.evaluate, inputs))
+        results.append(run_case(f"{shape}/evaluate_rule", lambda data, variables: evaluate_rule(rule, data, variables), inputs))
+
+    return {
+        "format_version": BENCHMARK_FORMAT_VERSION,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "params": {"customers": customers, "accounts": accounts, "segments": segments, "suppliers": suppliers,
+                   "depth": depth, "width": width, "shapes": list(shapes), "seed": seed},
+        "results": results,
+    }
+
+def compare(report, baseline, threshold=0.10):
+    """Cases whose throughput dropped or p99 grew by more than threshold against a baseline report."""
+    previous = {result["case"]: result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get(result["case"])
+        if before is None:
+            continue
+        if result["evals_per_sec"] < before["evals_per_sec"] * (1 - threshold) or \
+                result["p99_us"] > before["p99_us"] * (1 + threshold):
+            regressions.append({"case": result["case"],
+                                "evals_per_sec": (before["evals_per_sec"], result["evals_per_sec"]),
+                                "p99_us": (before["p99_us"], result["p99_us"])})
+    return regressions
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark rule evaluation over synthetic customers.")
+    arg_parser.add_argument("--customers", type=int, default=1000)
+    arg_parser.add_argument("--accounts", type=int, default=5)
+    arg_parser.add_argument("--segments", type=int, default=3)
+    arg_parser.add_argument("--suppliers", type=int, default=2)
+    arg_parser.add_argument("--depth", type=int, default=3)
+    arg_parser.add_argument("--width", type=int, default=3)
+    arg_parser.add_argument("--shapes", default="v3,v6,synthetic")
+    arg_parser.add_argument("--seed", type=int, default=42)
+    arg_parser.add_argument("--output", help="Write the JSON report to this file")
+    arg_parser.add_argument("--baseline", help="Compare against a previous JSON report")
+    arg_parser.add_argument("--threshold", type=float, default=0.10)
+    args = arg_parser.parse_args()
+
+    report = run_benchmark(args.customers, args.accounts, args.segments, args.suppliers,
+                           args.depth, args.width, args.shapes.split(","), args.seed)
+    for result in report["results"]:
+        print(f"{result['case']:<28} {result['evals_per_sec']:>12.0f} eval/s  "
+              f"p50 {result['p50_us']:>8.1f}us  p99 {result['p99_us']:>8.1f}us  "
+              f"{result['peak_alloc_bytes_per_eval']:>8.0f} B/eval")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['case']}: eval/s {regression['evals_per_sec']}, p99 {regression['p99_us']}")
+        if regressions:
+            raise SystemExit(1)
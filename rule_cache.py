@@ -0,0 +1,230 @@
+import json
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from Rule import compiled_plan
+from rule_store import rule_version
+
+# Placeholders in a cacheKey template, e.g. "${ruleName}_${personaId}"
+_PLACEHOLDER = re.compile(r"\$\{(\w+)\}")
+
+def interpolate_cache_key(template, rule, variables):
+    """Fill a cacheKey template from the rule name and the evaluation variables.
+
+    Returns None when a placeholder has no value, in which case the result is not cached.
+    """
+    values = dict(variables, ruleName=rule.name)
+    missing = False
+
+    def replace(match):
+        nonlocal missing
+        value = values.get(match.group(1))
+        if value is None:
+            missing = True
+            return ""
+        return str(value)
+
+    key = _PLACEHOLDER.sub(replace, template)
+    return None if missing else key
+
+def _backend_key(key):
+    """Shared-backend key for a (rule name, rule version, interpolated key) entry, unambiguous whatever the names contain."""
+    return json.dumps(list(key), separators=(",", ":"))
+
+class InMemoryBackend:
+    """Stand-in for a shared cache backend (e.g. Redis) that keeps entries in a local dict.
+
+    A backend only needs get(key) -> value or None and set(key, value, ttl).
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self.entries[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (self.clock() + ttl, value)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+class _InFlight:
+    """An evaluation in progress that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class RuleResultCache:
+    """TTL + LRU cache of rule results keyed by rule name, rule version and the rule's interpolated cacheKey.
+
+    Honors the rule's "cache" block: rules without cachable=true or without a
+    cacheKey are always evaluated, since a result is only reusable for inputs the
+    key identifies. Each rule's ttl (seconds) bounds how long its results live.
+    Keys are scoped to the rule both locally and in the backend, so two rules
+    with the same cacheKey template never share results, and to its
+    (ruleVersion, lastUpdated), so a reloaded rule never reads results another
+    process cached for the version it replaced.
+    Concurrent requests for the same key share one evaluation. Keys are indexed
+    by rule name, so one rule's results can be dropped without touching the rest.
+    """
+
+    def __init__(self, maxsize=10000, default_ttl=3600, backend=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self.backend = backend
+        self.clock = clock
+        self.entries = OrderedDict()  # (rule name, key) -> (expires_at, result, rule name)
+        self.rule_keys = {}  # rule name -> keys cached for it
+        self.generations = {}  # rule name -> bumped by invalidate_rule
+        self.versions = weakref.WeakKeyDictionary()  # CompiledRule -> rule_version of its rule
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def evaluate(self, rule, data, variables):
+        """Evaluate a rule through the cache.
+
+        data may be the payload dict or a zero-argument callable that fetches it,
+        so that a cache hit also skips the fetch.
+        """
+        rule = compiled_plan(rule)
+        settings = rule.rule.get("cache") or {}
+        key = None
+        if settings.get("cachable") and settings.get("cacheKey"):
+            key = interpolate_cache_key(settings["cacheKey"], rule, variables)
+        if key is None:
+            return rule.evaluate(data() if callable(data) else data, variables)
+        key = (rule.name, self._version(rule), key)
+
+        with self.lock:
+            found, result = self._get(key)
+            if found:
+                self.hits += 1
+                return result
+            flight = self.in_flight.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self.in_flight[key] = _InFlight()
+                generation = self.generations.get(rule.name, 0)
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            result = self.backend.get(_backend_key(key)) if self.backend is not None else None
+            ttl = settings.get("ttl", self.default_ttl)
+            computed = result is None
+            if computed:
+                result = rule.evaluate(data() if callable(data) else data, variables)
+            with self.lock:
+                # Skip results computed on a plan that was invalidated meanwhile
+                current = self.generations.get(rule.name, 0) == generation
+                if current:
+                    self._put(key, result, ttl, rule.name)
+            if current and computed and self.backend is not None:
+                self.backend.set(_backend_key(key), result, ttl)
+                with self.lock:
+                    current = self.generations.get(rule.name, 0) == generation
+                if not current and hasattr(self.backend, "delete"):
+                    self.backend.delete(_backend_key(key))  # Invalidated while it was being written
+            flight.result = result
+            return result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            flight.done.set()
+
+    def _version(self, rule):
+        version = self.versions.get(rule)
+        if version is None:
+            version = self.versions[rule] = rule_version(rule.rule)
+        return version
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, result, _ = entry
+        if expires_at <= self.clock():
+            self._remove(key)
+            return False, None
+        self.entries.move_to_end(key)
+        return True, result
+
+    def _put(self, key, result, ttl, rule_name):
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (self.clock() + ttl, result, rule_name)
+        self.rule_keys.setdefault(rule_name, set()).add(key)
+        while len(self.entries) > self.maxsize:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        _, _, rule_name = self.entries.pop(key)
+        keys = self.rule_keys[rule_name]
+        keys.discard(key)
+        if not keys:
+            del self.rule_keys[rule_name]
+
+    def invalidate(self, rule, key):
+        """Drop one rule's result for an interpolated cacheKey, locally and from the shared backend.
+
+        rule is the rule dict or CompiledRule, whose version selects the backend entry.
+        """
+        rule = compiled_plan(rule)
+        key = (rule.name, self._version(rule), key)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+        if self.backend is not None and hasattr(self.backend, "delete"):
+            self.backend.delete(_backend_key(key))
+
+    def invalidate_rule(self, rule_name):
+        """Drop every result cached for one rule, including evaluations still in flight.
+
+        Only keys this cache has seen are deleted from the shared backend; entries
+        other processes cached for an older version of the rule are never read
+        again, since the version is part of every key.
+        """
+        with self.lock:
+            self.generations[rule_name] = self.generations.get(rule_name, 0) + 1
+            keys = list(self.rule_keys.pop(rule_name, ()))
+            for key in keys:
+                del self.entries[key]
+        if self.backend is not None and hasattr(self.backend, "delete"):
+            for key in keys:
+                self.backend.delete(_backend_key(key))
+        return len(keys)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.rule_keys.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.maxsize}
@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import random
+import threading
+from aiohttp import web
+
+# Batch endpoint statuses meaning "this server has no batch endpoint"; callers fall back to single calls
+BATCH_UNSUPPORTED_STATUSES = {404, 405, 501}
+
+class AdaptiveBatchSize:
+    """Batch size that follows observed request latency.
+
+    Grows by half while batches come back in under half the target latency, and
+    halves when a batch is slower than the target or fails outright, so batches
+    settle at the largest size the rule engine answers within target_latency.
+    """
+
+    def __init__(self, initial=10, minimum=1, maximum=200, target_latency=1.0):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+
+    def observe(self, latency, failed=False):
+        if failed or latency > self.target_latency:
+            self.size = max(self.minimum, self.size // 2)
+        elif latency < self.target_latency / 2:
+            self.size = min(self.maximum, self.size + max(1, self.size // 2))
+
+def batch_payload(items, caller):
+    """Request body for (customer_id, rule_id) items."""
+    return {"caller": caller, "items": [{"customer_id": customer_id, "rule_id": rule_id} for customer_id, rule_id in items]}
+
+def parse_batch_results(body, items):
+    """One response dict per item from a batch response, or None for items the server failed.
+
+    Results are matched by position; a result naming a different customer or rule, or
+    carrying an "error", counts as failed so that only those items get retried.
+    """
+    results = body.get("results") or []
+    parsed = []
+    for position, (customer_id, rule_id) in enumerate(items):
+        result = results[position] if position < len(results) else None
+        if not isinstance(result, dict) or result.get("error") or "result" not in result or \
+                result.get("customer_id", customer_id) != customer_id or result.get("rule_id", rule_id) != rule_id:
+            parsed.append(None)
+        else:
+            parsed.append(result)
+    return parsed
+
+def create_stub_app(evaluate=None, supports_batch=True, failure_rate=0.0, latency=0.0, seed=None):
+    """A local stand-in for the rule engine API, for exercising the clients without the real service.
+
+    POST / takes {"customer_id", "rule_id", "caller"}; POST /batch takes {"caller", "items"}
+    and answers per-item, failing each item (or single call) with probability
+    failure_rate. evaluate(customer_id, rule_id) gives the result; by default odd
+    customer ids succeed.
+    """
+    evaluate = evaluate or (lambda customer_id, rule_id: "Success" if int(customer_id) % 2 else "Failure")
+    rng = random.Random(seed)
+    app = web.Application()
+    app["calls"] = {"single": 0, "batch": 0, "items": 0}
+
+    async def single(request):
+        app["calls"]["single"] += 1
+        body = await request.json()
+        if latency:
+            await asyncio.sleep(latency)
+        if rng.random() < failure_rate:
+            return web.json_response({"error": "unavailable"}, status=503)
+        return web.json_response({"customer_id": body["customer_id"], "rule_id": body["rule_id"],
+                                  "result": evaluate(body["customer_id"], body["rule_id"])})
+
+    async def batch(request):
+        if not supports_batch:
+            return web.json_response({"error": "not found"}, status=404)
+        app["calls"]["batch"] += 1
+        body = await request.json()
+        app["calls"]["items"] += len(body["items"])
+        if latency:
+            await asyncio.sleep(latency * (1 + len(body["items"]) / 100))
+        results = []
+        for item in body["items"]:
+            if rng.random() < failure_rate:
+                results.append({"customer_id": item["customer_id"], "rule_id": item["rule_id"], "error": "unavailable"})
+            else:
+                results.append({"customer_id": item["customer_id"], "rule_id": item["rule_id"],
+                                "result": evaluate(item["customer_id"], item["rule_id"])})
+        return web.json_response({"results": results})
+
+    app.router.add_post("/", single)
+    app.router.add_post("/batch", batch)
+    return app
+
+class StubRuleEngineServer:
+    """Serves create_stub_app on its own event loop in a background thread of this process.
+
+    Lets the services and their tests run against a local rule engine without a
+    separate process: start() returns once the server listens, and url is the
+    address to hand to RuleEngine. Port 0 picks a free port.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, **stub_options):
+        self.host = host
+        self.port = port
+        self.app = create_stub_app(**stub_options)
+        self.loop = None
+        self.runner = None
+        self.thread = None
+        self.url = None
+
+    def _serve(self, started):
+        asyncio.set_event_loop(self.loop)
+        self.runner = web.AppRunner(self.app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, self.host, self.port)
+        self.loop.run_until_complete(site.start())
+        self.port = self.runner.addresses[0][1]
+        self.url = f"http://{self.host}:{self.port}"
+        started.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(self.runner.cleanup())
+        self.loop.close()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.thread = threading.Thread(target=self._serve, args=(started,), name="stub-rule-engine", daemon=True)
+        self.thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Run a local stub of the rule engine API.")
+    arg_parser.add_argument("--port", type=int, default=8080)
+    arg_parser.add_argument("--no-batch", action="store_true", help="Answer /batch with 404")
+    arg_parser.add_argument("--failure-rate", type=float, default=0.0)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="Seconds per call")
+    args = arg_parser.parse_args()
+    web.run_app(create_stub_app(supports_batch=not args.no_batch, failure_rate=args.failure_rate,
+                                latency=args.latency), port=args.port)
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+import time
+import aiohttp
+from rule_planner import render_query
+
+# RateLimit units accepted in SchemaEntityAttributes, in seconds
+_RATE_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+def parse_rate_limit(value):
+    """Requests per second from a RateLimit value: a number (per second) or "N/s", "N/m", "N/h"."""
+    if value is None or value != value:  # None or NaN from a DataFrame
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    count, _, unit = str(value).partition("/")
+    return float(count) / _RATE_UNITS[unit.strip() or "s"]
+
+def rate_limits_from_attributes(entity_attributes):
+    """Per-DataSource rate limit from SchemaEntityAttributes rows; the strictest row wins."""
+    if hasattr(entity_attributes, "to_dict") and hasattr(entity_attributes, "columns"):
+        entity_attributes = entity_attributes.to_dict(orient="records")
+    limits = {}
+    for row in entity_attributes:
+        rate = parse_rate_limit(row.get("RateLimit"))
+        if rate is not None:
+            data_source = row["DataSource"]
+            limits[data_source] = min(rate, limits.get(data_source, rate))
+    return limits
+
+class TokenBucket:
+    """Token bucket allowing `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class GraphQLDataSource:
+    """Fetches root queries from a GraphQL endpoint over a shared aiohttp session."""
+
+    def __init__(self, url, session, timeout=10):
+        self.url = url
+        self.session = session
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def fetch(self, root, arguments, query):
+        async with self.session.post(self.url, json={"query": query}, timeout=self.timeout) as response:
+            response.raise_for_status()
+            body = await response.json()
+            if body.get("errors"):
+                raise RuntimeError(f"GraphQL errors from {self.url}: {body['errors']}")
+            return body["data"][root]
+
+class StubDataSource:
+    """Local stand-in for a data source; resolver(root, arguments) returns the root's value."""
+
+    def __init__(self, resolver, delay=0):
+        self.resolver = resolver
+        self.delay = delay
+        self.calls = []
+
+    async def fetch(self, root, arguments, query):
+        self.calls.append((root, arguments))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.resolver(root, arguments)
+
+def _covers(selection, requested):
+    """Whether a selection already includes every field of the requested one."""
+    return all(name in selection and _covers(selection[name], children) for name, children in requested.items())
+
+class DataFetcher:
+    """Fetches rule inputs from several data sources concurrently.
+
+    Requests to different data sources run in parallel, each source is throttled by
+    its own token bucket, and a request for a root query + arguments already in
+    flight with a covering selection waits on that request instead of issuing another.
+    """
+
+    def __init__(self, sources, rate_limits=None):
+        self.sources = sources  # DataSource -> object with async fetch(root, arguments, query)
+        self.buckets = {data_source: TokenBucket(rate) for data_source, rate in (rate_limits or {}).items()}
+        self.in_flight = {}  # (data_source, root, arguments) -> [(selection, task)]
+        self.requests = 0
+        self.coalesced = 0
+
+    async def fetch(self, data_source, root, arguments, selection):
+        key = (data_source, root, json.dumps(arguments, sort_keys=True, default=str))
+        for in_flight_selection, task in self.in_flight.get(key, []):
+            if _covers(in_flight_selection, selection):
+                self.coalesced += 1
+                return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self._fetch(data_source, root, arguments, selection))
+        entry = (selection, task)
+        self.in_flight.setdefault(key, []).append(entry)
+
+        def done(_):
+            entries = self.in_flight.get(key, [])
+            entries.remove(entry)
+            if not entries:
+                self.in_flight.pop(key, None)
+        task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+    async def _fetch(self, data_source, root, arguments, selection):
+        bucket = self.buckets.get(data_source)
+        if bucket is not None:
+            await bucket.acquire()
+        self.requests += 1
+        return await self.sources[data_source].fetch(root, arguments, render_query(root, arguments, selection))
+
+    async def fetch_plan(self, plan, variables):
+        """Fetch everything a DataPlan needs and assemble the rule's data payload."""
+        requests = plan.root_requests(variables)
+        results = await asyncio.gather(*(self.fetch(*request) for request in requests), return_exceptions=True)
+        data = {}
+        for (data_source, root, _, _), result in zip(requests, results):
+            if isinstance(result, Exception):
+                logging.error(f"Fetching {root} from {data_source} failed: {result}")
+                raise result
+            data[root] = result
+        return data
@@ -0,0 +1,147 @@
+import json
+import logging
+from Rule import CompiledRule
+
+def _records(table):
+    """Rows of a schema table given as a DataFrame or a list of dicts."""
+    if hasattr(table, "to_dict") and hasattr(table, "columns"):
+        return table.to_dict(orient="records")
+    return list(table)
+
+def _is_variable(value):
+    return isinstance(value, str) and value.startswith("$")
+
+def collect_fields(rule, variables=None):
+    """Map each entity path the rule reads ("customer", "branch.suppliers") to the attributes it needs.
+
+    When variables are given, optional filters whose variable is missing are skipped,
+    since they pass without reading their field.
+    """
+    if isinstance(rule, CompiledRule):
+        rule = rule.rule
+    fields = {}
+
+    def needs_filter(filter):
+        if variables is None or not filter.get("optional", False) or not _is_variable(filter["value"]):
+            return True
+        return variables.get(filter["value"][1:]) is not None
+
+    def add(entity, field):
+        if entity is None:
+            # Fields outside any entity are dot-paths from the payload root, e.g. "customer.age"
+            entity, _, field = field.partition(".")
+        fields.setdefault(entity, set()).add(field)
+
+    def visit(node, entity):
+        if "entity" in node:
+            entity = f"{entity}.{node['entity']}" if entity else node["entity"]
+            fields.setdefault(entity, set())
+        for filter in node.get("filters") or []:
+            if needs_filter(filter):
+                add(entity, filter["field"])
+        if "field" in node:
+            add(entity, node["field"])
+        for term in node.get("terms", []):
+            visit(term, entity)
+
+    for condition in rule["conditions"]:
+        visit(condition, None)
+    return fields
+
+class DataPlan:
+    """Minimal projection of the data a rule needs, grouped by data source."""
+
+    def __init__(self, sources, params, unresolved):
+        self.sources = sources  # data source -> {root field -> nested selection dict}
+        self.params = params  # root field -> parameter names of its root query
+        self.unresolved = unresolved  # entities no data source serves
+
+    def requirements(self):
+        """Sorted (DataSource, entity, attribute) triples the rule reads."""
+        triples = []
+
+        def walk(data_source, entity, selection):
+            for name, children in selection.items():
+                if children:
+                    walk(data_source, f"{entity}.{name}", children)
+                else:
+                    triples.append((data_source, entity, name))
+
+        for data_source, roots in self.sources.items():
+            for root, selection in roots.items():
+                walk(data_source, root, selection)
+        return sorted(triples)
+
+    def root_requests(self, variables):
+        """(data_source, root field, arguments, selection) for each root query the plan needs."""
+        return [(data_source, root, {param: variables.get(param) for param in self.params.get(root, [])}, selection)
+                for data_source, roots in self.sources.items()
+                for root, selection in roots.items()]
+
+    def queries(self, variables):
+        """One projected GraphQL query per data source, with root query arguments filled from variables."""
+        queries = {}
+        for data_source, root, arguments, selection in self.root_requests(variables):
+            queries[data_source] = queries.get(data_source, "") + _render_root(root, arguments, selection)
+        return {data_source: "{\n" + roots + "}" for data_source, roots in queries.items()}
+
+def render_query(root, arguments, selection):
+    """A GraphQL query for a single root field."""
+    return "{\n" + _render_root(root, arguments, selection) + "}"
+
+def _render_root(root, arguments, selection):
+    arguments = ", ".join(f"{param}: {json.dumps(value)}" for param, value in arguments.items())
+    head = f"{root}({arguments})" if arguments else root
+    return f"  {head} {{\n{_render_selection(selection, 2)}  }}\n"
+
+def _render_selection(selection, depth):
+    indent = "  " * depth
+    if not selection:
+        return f"{indent}__typename\n"
+    lines = ""
+    for name, children in selection.items():
+        if children:
+            lines += f"{indent}{name} {{\n{_render_selection(children, depth + 1)}{indent}}}\n"
+        else:
+            lines += f"{indent}{name}\n"
+    return lines
+
+def _root_field(root_query):
+    """Field name of a SchemaDataSource RootQuery such as "customer($customerId)"."""
+    return root_query.split("(", 1)[0].strip()
+
+def plan_data_requirements(rule, data_sources, variables=None):
+    """Work out which data sources, entities and attributes a rule needs.
+
+    data_sources are SchemaDataSource rows (DataSource, RootQuery, Params), as
+    produced by the GraphQL schema parsers. A top-level entity is served by the
+    data source whose root query field has the same name; nested entities come
+    from the same source as their parent.
+    """
+    root_sources = {}
+    params = {}
+    for row in _records(data_sources):
+        root = _root_field(row["RootQuery"])
+        root_sources[root] = row["DataSource"]
+        params[root] = [param.strip() for param in (row.get("Params") or "").split(",") if param.strip()]
+
+    sources = {}
+    unresolved = []
+    for entity, attributes in collect_fields(rule, variables).items():
+        path = entity.split(".")
+        data_source = root_sources.get(path[0])
+        if data_source is None:
+            unresolved.append(entity)
+            continue
+        selection = _select(sources.setdefault(data_source, {}).setdefault(path[0], {}), path[1:])
+        for attribute in sorted(attributes):
+            _select(selection, attribute.split("."))
+
+    if unresolved:
+        logging.warning(f"No data source serves entities: {unresolved}")
+    return DataPlan(sources, {root: params[root] for roots in sources.values() for root in roots}, unresolved)
+
+def _select(selection, fields):
+    for name in fields:
+        selection = selection.setdefault(name, {})
+    return selection
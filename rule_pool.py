@@ -0,0 +1,68 @@
+import collections
+import os
+from concurrent.futures import ProcessPoolExecutor
+from Rule import RuleSet
+
+# Rule network compiled once per worker process by _init_worker
+_worker_rules = None
+
+def _init_worker(rules):
+    global _worker_rules
+    _worker_rules = RuleSet(rules)
+
+def _evaluate_batch(records):
+    """Evaluate one batch; returns one bytes per rule with a 0/1 result per record."""
+    results = [_worker_rules.evaluate(data, variables) for data, variables in records]
+    return [bytes(result[rule_id] for result in results) for rule_id in _worker_rules.predicates]
+
+class RuleEvaluationPool:
+    """Evaluates a rule set over many records across worker processes.
+
+    Each worker compiles the rules once at startup. Records travel in batches that
+    the executor pickles, so values keep their types (tuples, datetimes, non-str
+    keys); results come back as one byte per record and rule, in input order.
+    """
+
+    def __init__(self, rules, processes=None, batch_size=1000, max_pending=None):
+        if not isinstance(rules, dict):
+            rules = RuleSet(rules).rules
+        self.rule_ids = list(rules)
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_pending = max_pending or 2 * self.processes
+        self.executor = ProcessPoolExecutor(self.processes, initializer=_init_worker, initargs=(rules,))
+
+    def evaluate(self, records):
+        """Yield {rule_id: result} for each (data, variables) record, in input order."""
+        pending = collections.deque()
+
+        def drain():
+            columns = pending.popleft().result()
+            for row in zip(*columns):
+                yield dict(zip(self.rule_ids, map(bool, row)))
+
+        try:
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) == self.batch_size:
+                    pending.append(self.executor.submit(_evaluate_batch, batch))
+                    batch = []
+                    if len(pending) >= self.max_pending:
+                        yield from drain()
+            if batch:
+                pending.append(self.executor.submit(_evaluate_batch, batch))
+            while pending:
+                yield from drain()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,150 @@
+import logging
+import threading
+from Rule import compile_rule
+from rule_store import rule_version
+
+class DictRuleSource:
+    """In-memory rule source: rule_id -> rule dict. A source only needs versions() and load(rule_id)."""
+
+    def __init__(self, rules=None):
+        self.rules = dict(rules or {})
+
+    def versions(self):
+        return {rule_id: rule_version(rule) for rule_id, rule in self.rules.items()}
+
+    def load(self, rule_id):
+        return self.rules[rule_id]
+
+def rule_dependencies(rule):
+    """Names of the rules a rule depends on, from v6 metadata.dependencies."""
+    return list(rule.get("metadata", {}).get("dependencies") or [])
+
+class RuleRegistry:
+    """The current compiled version of every rule, kept up to date while the service runs.
+
+    refresh() compares the source's (ruleVersion, lastUpdated) stamps with the
+    loaded ones, recompiles only the rules that changed, and publishes the new
+    set by replacing one dict, so an evaluation that already looked up a rule
+    finishes on the plan it started with. Cached results are evicted for the
+    changed rules and for every rule that depends on them, directly or through
+    metadata.dependencies chains. start() polls in a background thread; notify()
+    wakes it early when a change subscription fires.
+    """
+
+    def __init__(self, source, cache=None, interval=30, store=None):
+        self.source = source
+        self.cache = cache  # RuleResultCache whose entries follow rule changes
+        self.interval = interval
+        self.store = store  # CompiledRuleStore with prebuilt plans to start from
+        self.rules = {}  # rule_id -> CompiledRule, replaced wholesale on every change
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.reloads = 0
+
+    def get(self, rule_id):
+        return self.rules.get(rule_id)
+
+    def evaluate(self, rule_id, data, variables):
+        """Evaluate the current version of a rule, through the result cache when there is one."""
+        rule = self.rules[rule_id]
+        if self.cache is not None:
+            return self.cache.evaluate(rule, data, variables)
+        return rule.evaluate(data() if callable(data) else data, variables)
+
+    def _compile(self, rule_id, version):
+        if self.store is not None:
+            compiled = self.store.get(rule_id, version)
+            if compiled is not None:
+                return compiled
+        return compile_rule(self.source.load(rule_id))
+
+    def dependents(self, rule_ids, rules=None):
+        """Rule ids that depend on any of rule_ids, transitively; dependencies name rules by id or rule name."""
+        rules = self.rules if rules is None else rules
+        depended_on = {}
+        for rule_id, compiled in rules.items():
+            for dependency in rule_dependencies(compiled.rule):
+                depended_on.setdefault(dependency, set()).add(rule_id)
+
+        found = set()
+        pending = list(rule_ids)
+        while pending:
+            rule_id = pending.pop()
+            names = {rule_id}
+            if rule_id in rules:
+                names.add(rules[rule_id].name)
+            for name in names:
+                for dependent in depended_on.get(name, ()):
+                    if dependent not in found and dependent not in rule_ids:
+                        found.add(dependent)
+                        pending.append(dependent)
+        return found
+
+    def refresh(self):
+        """Reload rules whose version changed; returns the ids of changed and invalidated rules."""
+        with self.lock:
+            versions = self.source.versions()
+            changed = {rule_id for rule_id, version in versions.items() if self.versions.get(rule_id) != version}
+            removed = set(self.versions) - set(versions)
+            if not changed and not removed:
+                return set()
+
+            rules = {rule_id: plan for rule_id, plan in self.rules.items() if rule_id not in removed}
+            for rule_id in sorted(changed):
+                try:
+                    rules[rule_id] = self._compile(rule_id, versions[rule_id])
+                except Exception as e:
+                    # Keep serving the previous plan; the next refresh retries
+                    logging.error(f"Recompiling rule {rule_id} failed: {e}")
+                    changed.discard(rule_id)
+                    if rule_id in self.versions:
+                        versions[rule_id] = self.versions[rule_id]
+                    else:
+                        del versions[rule_id]
+            changed |= removed
+
+            # Dependencies are looked up in both plans, in case one side dropped or added them
+            affected = changed | self.dependents(changed, self.rules) | self.dependents(changed, rules)
+            previous = self.rules
+            self.rules = rules
+            self.versions = versions
+            self.reloads += 1
+
+        if self.cache is not None:
+            names = {plans[rule_id].name for plans in (previous, rules) for rule_id in affected if rule_id in plans}
+            for name in names:
+                self.cache.invalidate_rule(name)
+        if affected:
+            logging.info(f"Reloaded rules {sorted(changed)}, invalidated {sorted(affected - changed)}")
+        return affected
+
+    def notify(self):
+        """Ask the background poller to refresh now, e.g. from a rule-change subscription."""
+        self.wakeup.set()
+
+    def _poll(self):
+        while not self.stopped.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Rule refresh failed: {e}")
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    def start(self):
+        """Load every rule, then keep refreshing in a background thread."""
+        self.refresh()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._poll, name="rule-registry", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
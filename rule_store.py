@@ -0,0 +1,231 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from datetime import datetime, timezone
+from Rule import compile_rule, get_rule_name, parse_expression, coerce_constant
+
+# Artifact layout: header, JSON index, then one compact JSON plan per rule
+ARTIFACT_MAGIC = b"RULEPLAN"
+ARTIFACT_FORMAT_VERSION = 2  # 2: plans keep the cache block and dependencies
+_HEADER = struct.Struct("<8sHIQI")  # magic, format version, rule count, index length, index crc32
+
+def normalize_timestamp(value):
+    """A lastUpdated value as UTC ISO 8601 ("2024-03-03T15:30:00Z"), whether it came as a datetime or a string.
+
+    Rule JSON and database rows spell the same instant differently; naive times are
+    taken as UTC, and strings that aren't timestamps are kept as they are.
+    """
+    if value is None:
+        return None
+    if hasattr(value, "to_pydatetime"):  # pandas Timestamp
+        value = value.to_pydatetime()
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value).strip())
+        except ValueError:
+            return str(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+def rule_version(rule):
+    """(ruleVersion, lastUpdated) of a rule dict, from v6-style metadata or the v3 top level."""
+    metadata = rule.get("metadata", {})
+    version = metadata.get("ruleVersion", rule.get("version"))
+    updated = metadata.get("lastUpdated", metadata.get("last_updated", rule.get("last_updated")))
+    return (None if version is None else str(version), normalize_timestamp(updated))
+
+def versions_from_rows(rows):
+    """rule_id -> (version, last_updated) from RULE table rows, given as a DataFrame or dicts."""
+    if hasattr(rows, "to_dict") and hasattr(rows, "columns"):
+        rows = rows.to_dict(orient="records")
+    return {row["rule_id"]: (str(row["version"]), normalize_timestamp(row["last_updated"])) for row in rows}
+
+def _fold_value(value, type_name):
+    """Pre-evaluate constant JUEL expressions and coerce literals to their declared type."""
+    if isinstance(value, dict) and "expr" in value:
+        expr = value["expr"]
+        if expr.get("language") != "juel":
+            return value
+        parsed = parse_expression(expr["expression"])
+        if parsed.variables():
+            return value
+        value = parsed.evaluate({})
+        if isinstance(value, str) and value.startswith("$"):
+            return {"expr": expr}  # Folding would turn it into a $variable reference
+    elif isinstance(value, str) and value.startswith("$"):
+        return value
+    return coerce_constant(value, type_name)
+
+def _plan_node(node):
+    node = dict(node)
+    if "value" in node:
+        node["value"] = _fold_value(node["value"], node.get("type"))
+    if node.get("filters"):
+        node["filters"] = [_plan_node(filter) for filter in node["filters"]]
+    if "terms" in node:
+        node["terms"] = [_plan_node(term) for term in node["terms"]]
+    return node
+
+def build_plan(rule):
+    """The evaluation plan of a rule: its name, version, dependencies, cache block and conditions, with constants folded.
+
+    Everything else (actions, documentation, ...) is dropped; what is kept is what
+    the evaluator, RuleResultCache and RuleRegistry read. The plan is compiled once
+    here so a rule that can't compile never gets stored.
+    """
+    version, updated = rule_version(rule)
+    metadata = {"ruleName": get_rule_name(rule), "ruleVersion": version, "lastUpdated": updated}
+    dependencies = rule.get("metadata", {}).get("dependencies")
+    if dependencies:
+        metadata["dependencies"] = list(dependencies)
+    plan = {"metadata": metadata, "conditions": [_plan_node(condition) for condition in rule["conditions"]]}
+    if rule.get("cache"):
+        plan["cache"] = dict(rule["cache"])
+    compile_rule(plan)
+    return plan
+
+def _write(path, entries):
+    """Write (rule_id, version, last_updated, plan bytes) entries atomically to path."""
+    index = []
+    offset = 0
+    for rule_id, version, updated, blob in entries:
+        index.append([rule_id, version, updated, offset, len(blob), zlib.crc32(blob)])
+        offset += len(blob)
+    index_bytes = json.dumps(index, separators=(",", ":")).encode()
+    header = _HEADER.pack(ARTIFACT_MAGIC, ARTIFACT_FORMAT_VERSION, len(index), len(index_bytes),
+                          zlib.crc32(index_bytes))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=".rules-")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(header)
+            file.write(index_bytes)
+            for _, _, _, blob in entries:
+                file.write(blob)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)  # Readers keep their mapping of the old file
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def _entry(rule_id, rule):
+    plan = build_plan(rule)
+    version, updated = rule_version(plan)
+    return rule_id, version, updated, json.dumps(plan, separators=(",", ":")).encode()
+
+def save_rules(path, rules):
+    """Build the plans of rules (rule_id -> rule dict) and write them as one artifact."""
+    _write(path, [_entry(rule_id, rule) for rule_id, rule in rules.items()])
+
+def approve_rules(path, rules):
+    """Add or replace the plans of newly approved rules in an artifact, keeping every other plan as is."""
+    entries = {}
+    if os.path.exists(path):
+        with CompiledRuleStore(path) as store:
+            for rule_id in store.rule_ids():
+                version, updated = store.version(rule_id)
+                entries[rule_id] = (rule_id, version, updated, store.plan_bytes(rule_id))
+    for rule_id, rule in rules.items():
+        entries[rule_id] = _entry(rule_id, rule)
+    _write(path, list(entries.values()))
+
+class CompiledRuleStore:
+    """Read-only view of a compiled-rule artifact, memory-mapped in one call.
+
+    Opening reads only the header and index; each plan is checksummed, decoded and
+    compiled the first time it is asked for. A plan is stale when its recorded
+    ruleVersion/lastUpdated differs from the rule's current one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, format_version, count, index_length, index_crc = _HEADER.unpack_from(self.buffer)
+        if magic != ARTIFACT_MAGIC:
+            raise ValueError(f"{path} is not a compiled-rule artifact")
+        if format_version != ARTIFACT_FORMAT_VERSION:
+            raise ValueError(f"{path} has artifact format {format_version}, expected {ARTIFACT_FORMAT_VERSION}; rebuild it")
+        index_bytes = self.buffer[_HEADER.size:_HEADER.size + index_length]
+        if zlib.crc32(index_bytes) != index_crc:
+            raise ValueError(f"{path} has a corrupt index")
+        base = _HEADER.size + index_length
+        self.index = {rule_id: (version, updated, base + offset, length, crc)
+                      for rule_id, version, updated, offset, length, crc in json.loads(index_bytes)}
+        if len(self.index) != count:
+            raise ValueError(f"{path} has a truncated index")
+        self.compiled = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, rule_id):
+        return rule_id in self.index
+
+    def rule_ids(self):
+        return list(self.index)
+
+    def version(self, rule_id):
+        """(ruleVersion, lastUpdated) the stored plan was built from."""
+        version, updated, _, _, _ = self.index[rule_id]
+        return version, updated
+
+    def is_current(self, rule_id, version):
+        """Whether the stored plan was built from version, (ruleVersion, lastUpdated) in any timestamp spelling."""
+        version, updated = version
+        version = (None if version is None else str(version), normalize_timestamp(updated))
+        return rule_id in self.index and self.version(rule_id) == version
+
+    def stale(self, versions):
+        """Rule ids in versions (rule_id -> (version, last_updated)) whose plan is missing or out of date."""
+        return [rule_id for rule_id, version in versions.items() if not self.is_current(rule_id, version)]
+
+    def plan_bytes(self, rule_id):
+        _, _, start, length, crc = self.index[rule_id]
+        blob = self.buffer[start:start + length]
+        if zlib.crc32(blob) != crc:
+            raise ValueError(f"Plan for {rule_id} in {self.path} fails its checksum")
+        return blob
+
+    def plan(self, rule_id):
+        return json.loads(self.plan_bytes(rule_id))
+
+    def get(self, rule_id, version=None):
+        """The CompiledRule for rule_id, or None if it isn't stored or doesn't match version."""
+        if rule_id not in self.index or (version is not None and not self.is_current(rule_id, version)):
+            return None
+        compiled = self.compiled.get(rule_id)
+        if compiled is None:
+            compiled = self.compiled[rule_id] = compile_rule(self.plan(rule_id))
+        return compiled
+
+    def close(self):
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Add approved rules to a compiled-rule artifact.")
+    arg_parser.add_argument("artifact", help="Artifact file, created if missing")
+    arg_parser.add_argument("rules", nargs="+", help="Rule JSON files; each rule is stored under its rule name")
+    args = arg_parser.parse_args()
+
+    approved = {}
+    for rule_path in args.rules:
+        with open(rule_path) as file:
+            rule = json.load(file)
+        approved[get_rule_name(rule)] = rule
+    approve_rules(args.artifact, approved)
+    with CompiledRuleStore(args.artifact) as store:
+        print(f"{args.artifact}: {len(store)} rules")
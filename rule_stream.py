@@ -0,0 +1,182 @@
+import argparse
+import collections
+import csv
+import itertools
+import json
+import re
+import sys
+from Rule import CompiledRule, RuleSet, compile_rule
+
+# A CSV column path segment such as "account[0]"
+_INDEXED = re.compile(r"^(\w+)\[(\d+)\]$")
+
+def _chunks(rows, chunk_size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def _reject_constant(name):
+    raise ValueError(f"Not a finite number: {name}")
+
+def _parse_cell(value):
+    """CSV cells are strings; read numbers, booleans and null as JSON, anything else stays a string.
+
+    NaN, Infinity and -Infinity stay strings too, as JSON itself doesn't allow them.
+    """
+    if value == "":
+        return None
+    try:
+        return json.loads(value, parse_constant=_reject_constant)
+    except ValueError:
+        return value
+
+class _Gap(dict):
+    """Padding for list positions no column has filled (yet); see _drop_gaps."""
+
+def _assign(target, path, value):
+    """Set a dotted column path ("account[0].balance") inside nested dicts and lists."""
+    segments = path.split(".")
+    for i, segment in enumerate(segments):
+        last = i == len(segments) - 1
+        match = _INDEXED.match(segment)
+        if match:
+            name, position = match.group(1), int(match.group(2))
+            items = target.setdefault(name, [])
+            while len(items) <= position:
+                items.append(_Gap())
+            if last:
+                items[position] = value
+            target = items[position]
+        elif last:
+            target[segment] = value
+        else:
+            target = target.setdefault(segment, {})
+
+def _drop_gaps(value):
+    """Remove list entries no column filled, so e.g. count aggregates see only real rows."""
+    if isinstance(value, list):
+        return [_drop_gaps(item) for item in value if not (type(item) is _Gap and not item)]
+    if isinstance(value, dict):
+        return {key: _drop_gaps(item) for key, item in value.items()}
+    return value
+
+def assemble_csv_row(row):
+    """Turn a flat CSV row into (data, variables).
+
+    Columns are dotted entity paths ("customer.age", "account[0].balance"); columns
+    starting with "$" are rule variables. List entries left empty are dropped.
+    """
+    data = {}
+    variables = {}
+    for column, cell in row.items():
+        value = _parse_cell(cell)
+        if column.startswith("$"):
+            variables[column[1:]] = value
+        elif value is not None:
+            _assign(data, column, value)
+    return _drop_gaps(data), variables
+
+def assemble_json_record(record):
+    """A JSONL record is either {"data": ..., "variables": ...} or the data payload itself."""
+    if "data" in record:
+        return record["data"], record.get("variables", {})
+    return record, {}
+
+def read_records(input_file, format="jsonl", chunk_size=1000):
+    """Lazily yield chunks of (data, variables) from a JSONL or CSV file object."""
+    if format == "jsonl":
+        rows = (assemble_json_record(json.loads(line)) for line in input_file if line.strip())
+    elif format == "csv":
+        rows = (assemble_csv_row(row) for row in csv.DictReader(input_file))
+    else:
+        raise ValueError(f"Unsupported input format: {format}")
+    return _chunks(rows, chunk_size)
+
+def _record_id(data, id_field):
+    value = data
+    for field in id_field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(field)
+    return value
+
+def _pooled_results(pool, records):
+    """Yield (record, outcome) pairs from one pool.evaluate call over all records.
+
+    The pool reads ahead up to its max_pending batches; only those records are held
+    here, waiting for their results.
+    """
+    waiting = collections.deque()
+
+    def feed():
+        for record in records:
+            waiting.append(record)
+            yield record
+
+    for outcome in pool.evaluate(feed()):
+        yield waiting.popleft(), outcome
+
+def stream_evaluate(rules, input_file, output_file, format="jsonl", chunk_size=1000,
+                    id_field="customer.customer_id", only_matches=False, output_format="jsonl"):
+    """Evaluate rules over a large input file chunk by chunk, writing one line per record.
+
+    rules may be a rule dict, a CompiledRule, a RuleSet or a RuleEvaluationPool. Input
+    is read chunk by chunk; a pool is given every record as one lazy stream, so all
+    its workers stay busy and its max_pending bounds how far reading runs ahead.
+    Output is flushed every chunk_size records so a slow consumer throttles reading.
+    """
+    if isinstance(rules, dict):
+        rules = compile_rule(rules)
+    records = itertools.chain.from_iterable(read_records(input_file, format, chunk_size))
+    if isinstance(rules, (CompiledRule, RuleSet)):
+        results = ((record, rules.evaluate(*record)) for record in records)
+    else:
+        results = _pooled_results(rules, records)
+
+    writer = csv.writer(output_file) if output_format == "csv" else None
+    if writer:
+        writer.writerow(["id", "result"])
+    counts = {"records": 0, "matched": 0}
+    for (data, _), outcome in results:
+        matched = any(outcome.values()) if isinstance(outcome, dict) else bool(outcome)
+        counts["records"] += 1
+        counts["matched"] += matched
+        if not only_matches or matched:
+            record_id = _record_id(data, id_field)
+            if writer:
+                writer.writerow([record_id, json.dumps(outcome)])
+            else:
+                output_file.write(json.dumps({"id": record_id, "result": outcome}) + "\n")
+        if counts["records"] % chunk_size == 0:
+            output_file.flush()
+    output_file.flush()
+    return counts
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Evaluate a rule over a JSONL or CSV export.")
+    arg_parser.add_argument("rule", help="Rule JSON file")
+    arg_parser.add_argument("input", help="Input file, or - for stdin")
+    arg_parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    arg_parser.add_argument("--output", help="Output file (default stdout)")
+    arg_parser.add_argument("--output-format", choices=["jsonl", "csv"], default="jsonl")
+    arg_parser.add_argument("--chunk-size", type=int, default=1000)
+    arg_parser.add_argument("--id-field", default="customer.customer_id")
+    arg_parser.add_argument("--only-matches", action="store_true")
+    args = arg_parser.parse_args()
+
+    with open(args.rule) as file:
+        rule = json.load(file)
+    input_file = sys.stdin if args.input == "-" else open(args.input, newline="")
+    output_file = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        counts = stream_evaluate(rule, input_file, output_file, args.format, args.chunk_size,
+                                 args.id_field, args.only_matches, args.output_format)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+    print(f"Evaluated {counts['records']} records, {counts['matched']} matched", file=sys.stderr)
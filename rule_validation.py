@@ -0,0 +1,173 @@
+import json
+import os
+from Rule import AGGREGATES, OPERATORS, TYPES, coerce_constant, parse_expression
+
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "json_grammer.json")
+
+# GraphQL scalar types in SchemaEntityAttributes -> rule types they can be compared as
+ATTRIBUTE_TYPES = {
+    "String": {"string"},
+    "ID": {"string", "integer"},
+    "Int": {"integer", "number"},
+    "Float": {"number"},
+    "Boolean": {"boolean"},
+}
+
+class RuleValidationError(ValueError):
+    """A rule that doesn't match the grammar or the schema; errors lists every problem found."""
+
+    def __init__(self, errors):
+        super().__init__("Invalid rule:\n  " + "\n  ".join(errors))
+        self.errors = errors
+
+def load_grammar(path=GRAMMAR_PATH):
+    with open(path) as file:
+        return json.load(file)
+
+# JSON Schema type names -> check on a parsed JSON value
+_JSON_TYPES = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+
+def _schema_errors(value, schema, root, path):
+    """Errors for value against the subset of JSON Schema json_grammer.json uses."""
+    if "$ref" in schema:
+        target = root
+        for part in schema["$ref"].lstrip("#/").split("/"):
+            target = target[part]
+        return _schema_errors(value, target, root, path)
+    if "anyOf" in schema or "oneOf" in schema:
+        options = schema.get("anyOf") or schema["oneOf"]
+        results = [_schema_errors(value, option, root, path) for option in options]
+        matched = sum(not errors for errors in results)
+        if matched == 0:
+            # Report the closest alternative rather than all of them
+            return min(results, key=len)
+        if "oneOf" in schema and matched > 1:
+            return [f"{path}: matches more than one alternative"]
+        return []
+
+    types = schema.get("type")
+    if types is not None:
+        types = types if isinstance(types, list) else [types]
+        if not any(_JSON_TYPES[name](value) for name in types):
+            return [f"{path}: expected {' or '.join(types)}, got {json.dumps(value)}"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path}: {json.dumps(value)} is not one of {schema['enum']}"]
+
+    errors = []
+    if isinstance(value, dict):
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(f"{path}: missing required property {name!r}")
+        properties = schema.get("properties", {})
+        extra = schema.get("additionalProperties", True)
+        for name, item in value.items():
+            if name in properties:
+                errors += _schema_errors(item, properties[name], root, f"{path}.{name}")
+            elif extra is False:
+                errors.append(f"{path}: unexpected property {name!r}")
+            elif isinstance(extra, dict):
+                errors += _schema_errors(item, extra, root, f"{path}.{name}")
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors += _schema_errors(item, schema["items"], root, f"{path}[{i}]")
+    return errors
+
+def _attribute_types(entity_attributes):
+    """(entity, attribute) -> GraphQL type from SchemaEntityAttributes rows with an AttributeType."""
+    if hasattr(entity_attributes, "to_dict") and hasattr(entity_attributes, "columns"):
+        entity_attributes = entity_attributes.to_dict(orient="records")
+    types = {}
+    for row in entity_attributes:
+        if row.get("AttributeType"):
+            types[(row["EntityName"].lower(), row["AttributeName"])] = row["AttributeType"]
+    return types
+
+def _declared_type(attribute_types, entity, field):
+    """GraphQL type of entity.field; rule entities are field names ("account"), schema entities type names ("Account")."""
+    if entity is None:
+        entity, _, field = field.partition(".")
+    entity = entity.split(".")[-1].lower()
+    for name in (entity, entity.rstrip("s")):
+        if (name, field) in attribute_types:
+            return attribute_types[(name, field)]
+    return None
+
+def _semantic_errors(rule, attribute_types):
+    """Errors the grammar can't express: literals of the wrong type, bad expressions, schema type conflicts."""
+    errors = []
+
+    def check_leaf(node, entity, path):
+        type_name = node.get("type")
+        function = node.get("function")
+        if node.get("operator") not in OPERATORS:
+            errors.append(f"{path}: unsupported operator {node.get('operator')!r}")
+        if function != "comp" and function not in AGGREGATES:
+            errors.append(f"{path}: unsupported function {function!r}")
+        value = node.get("value")
+        if isinstance(value, dict) and "expr" in value:
+            expr = value["expr"]
+            if expr.get("language") != "juel":
+                errors.append(f"{path}: unsupported expression language {expr.get('language')!r}")
+            else:
+                try:
+                    parsed = parse_expression(expr["expression"])
+                    if not parsed.variables():
+                        coerce_constant(parsed.evaluate({}), type_name)
+                except Exception as e:
+                    errors.append(f"{path}: bad expression {expr['expression']!r}: {e}")
+        elif not (isinstance(value, str) and value.startswith("$")):
+            try:
+                coerce_constant(value, type_name)
+            except ValueError as e:
+                errors.append(f"{path}: {e}")
+        if type_name in TYPES and function in ("comp", "min", "max", "sum", "avg"):
+            declared = _declared_type(attribute_types, entity, node.get("field", ""))
+            if declared in ATTRIBUTE_TYPES and type_name not in ATTRIBUTE_TYPES[declared]:
+                errors.append(f"{path}: {node['field']} is {declared} in the schema but typed {type_name}")
+
+    def visit(node, entity, path):
+        if "entity" in node:
+            entity = f"{entity}.{node['entity']}" if entity else node["entity"]
+        for i, filter in enumerate(node.get("filters") or []):
+            check_leaf(filter, entity, f"{path}.filters[{i}]")
+        if "terms" in node:
+            for i, term in enumerate(node["terms"]):
+                visit(term, entity, f"{path}.terms[{i}]")
+        elif "field" in node:
+            check_leaf(node, entity, path)
+
+    for i, condition in enumerate(rule.get("conditions", [])):
+        visit(condition, None, f"conditions[{i}]")
+    return errors
+
+def validate_rule(rule, grammar=None, entity_attributes=None):
+    """Check a rule dict ahead of evaluation, raising RuleValidationError listing every problem.
+
+    The rule is checked against json_grammer.json (or the given grammar), then its
+    literals against their declared types, and, given SchemaEntityAttributes rows
+    with an AttributeType column, each declared type against the schema's.
+    """
+    if grammar is None:
+        grammar = load_grammar()
+    errors = _schema_errors(rule, grammar, grammar, "rule")
+    if not errors:
+        errors = _semantic_errors(rule, _attribute_types([] if entity_attributes is None else entity_attributes))
+    if errors:
+        raise RuleValidationError(errors)
+    return rule
+
+def parse_rule(text, grammar=None, entity_attributes=None):
+    """Parse rule JSON text and validate it, so malformed rules fail before any record is evaluated."""
+    try:
+        rule = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise RuleValidationError([f"line {e.lineno}, column {e.colno}: {e.msg}"]) from e
+    return validate_rule(rule, grammar, entity_attributes)
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Background sampling run settings
+JOB_WORKERS = 4  # Runs executing at once
+MAX_QUEUED_JOBS = 16  # Runs waiting for a worker before new ones are refused
+JOB_HISTORY = 100  # Finished runs kept for polling
+
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+class JobQueueFull(Exception):
+    """Raised by JobManager.submit when every worker is busy and the queue is at its limit."""
+
+class JobCancelled(Exception):
+    """Raised inside a run's work once the run has been cancelled."""
+
+class SamplingJob:
+    """One background sampling run: its status, progress counters and partial aggregates.
+
+    The run reports through record_calls() and record_sample(), which process_samples
+    calls as rule engine calls and samples complete. cancel() stops a queued run
+    before it starts and cancels the asyncio task of a running one, which aborts the
+    rule engine requests still in flight.
+    """
+
+    def __init__(self, run_id, params=None):
+        self.run_id = run_id
+        self.params = params or {}
+        self.status = "queued"  # queued -> running -> completed / failed / cancelled
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+        self.cancel_requested = threading.Event()
+        self.loop = None  # Event loop and task of the running coroutine, for cancel()
+        self.task = None
+        self.sink = None  # ResultSink whose counters are the partial aggregates
+        self.samples_total = 0
+        self.samples_completed = 0
+        self.customers_total = 0
+        self.customers_processed = 0
+        self.rule_calls_total = 0
+        self.rule_calls_completed = 0
+        self.rule_errors = 0
+
+    def start(self):
+        """Mark the run as running; False if it was cancelled while queued."""
+        with self.lock:
+            if self.status != "queued":
+                return False
+            self.status = "running"
+            self.started_at = time.time()
+            return True
+
+    def finish(self, status, result=None, error=None):
+        with self.lock:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            self.loop = self.task = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def set_totals(self, samples, rule_count, sink=None):
+        """Record the work ahead once the samples are drawn: samples are DataFrames of customers."""
+        with self.lock:
+            self.samples_total = len(samples)
+            self.customers_total = sum(len(sample) for sample in samples)
+            self.rule_calls_total = self.customers_total * rule_count
+            self.sink = sink
+
+    def record_calls(self, calls, errors=0):
+        with self.lock:
+            self.rule_calls_completed += calls
+            self.rule_errors += errors
+
+    def record_sample(self, sample_number, customers):
+        with self.lock:
+            self.samples_completed += 1
+            self.customers_processed += customers
+
+    def check_cancelled(self):
+        if self.cancel_requested.is_set():
+            raise JobCancelled(self.run_id)
+
+    def run_coroutine(self, coroutine):
+        """asyncio.run(coroutine) as this job's task, so that cancel() can interrupt it; raises JobCancelled if it was."""
+        async def main():
+            with self.lock:
+                self.loop = asyncio.get_running_loop()
+                self.task = asyncio.current_task()
+            try:
+                self.check_cancelled()  # Cancelled before the task could be reached
+                return await coroutine
+            except asyncio.CancelledError:
+                raise JobCancelled(self.run_id)
+            finally:
+                coroutine.close()  # No-op once awaited; stops "never awaited" warnings otherwise
+                with self.lock:
+                    self.loop = self.task = None
+
+        return asyncio.run(main())
+
+    def cancel(self):
+        """Ask the run to stop; returns False if it had already finished."""
+        self.cancel_requested.set()
+        with self.lock:
+            if self.status in FINISHED_STATES:
+                return False
+            if self.status == "queued":
+                self.status = "cancelled"
+                self.finished_at = time.time()
+            elif self.task is not None:
+                self.loop.call_soon_threadsafe(self.task.cancel)
+        return True
+
+    def progress(self):
+        with self.lock:
+            return {
+                "run_id": self.run_id,
+                "status": self.status,
+                "error": self.error,
+                "cancel_requested": self.cancel_requested.is_set(),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "samples_total": self.samples_total,
+                "samples_completed": self.samples_completed,
+                "customers_total": self.customers_total,
+                "customers_processed": self.customers_processed,
+                "rule_calls_total": self.rule_calls_total,
+                "rule_calls_completed": self.rule_calls_completed,
+                "rule_errors": self.rule_errors,
+                "error_rate": self.rule_errors / self.rule_calls_completed if self.rule_calls_completed else 0.0,
+            }
+
+    def aggregates(self):
+        """Run, rule and sample aggregates over the samples completed so far."""
+        if self.status == "completed" and self.result is not None:
+            return self.result
+        return self.sink.aggregates() if self.sink is not None else []
+
+class JobManager:
+    """Runs sampling jobs on a fixed pool of background threads with a bounded queue.
+
+    submit() refuses new runs with JobQueueFull once max_workers are running and
+    max_queued are waiting, so a burst of requests can't pile up unbounded work.
+    The last `history` finished runs stay available for polling.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, max_queued=MAX_QUEUED_JOBS, history=JOB_HISTORY):
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="sampling-job")
+        self.slots = threading.BoundedSemaphore(max_workers + max_queued)
+        self.history = history
+        self.jobs = {}  # run_id -> SamplingJob, in submission order
+        self.lock = threading.Lock()
+
+    def submit(self, run_id, work, params=None):
+        """Queue work(job) to run in the background as run_id; returns the SamplingJob."""
+        if not self.slots.acquire(blocking=False):
+            raise JobQueueFull("Too many sampling runs in progress; retry later")
+        job = SamplingJob(run_id, params)
+        with self.lock:
+            self.jobs[run_id] = job
+            self._prune()
+        try:
+            self.executor.submit(self._run, job, work)
+        except RuntimeError:  # Shut down
+            self.slots.release()
+            raise
+        return job
+
+    def _run(self, job, work):
+        try:
+            if not job.start():
+                return
+            job.finish("completed", result=work(job))
+            logging.info(f"Sampling run {job.run_id} completed.")
+        except JobCancelled:
+            job.finish("cancelled")
+            logging.info(f"Sampling run {job.run_id} cancelled.")
+        except Exception as e:
+            logging.exception(f"Sampling run {job.run_id} failed")
+            job.finish("failed", error=str(e))
+        finally:
+            self.slots.release()
+
+    def _prune(self):
+        finished = [run_id for run_id, job in self.jobs.items() if job.finished]
+        for run_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[run_id]
+
+    def get(self, run_id):
+        return self.jobs.get(run_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, run_id):
+        """Cancel run_id; returns the job, or None if there is no such run."""
+        job = self.jobs.get(run_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for job in self.list():
+                job.cancel()
+        self.executor.shutdown(wait=True)
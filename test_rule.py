@@ -0,0 +1,79 @@
+import json
+import random
+import pytest
+import Rule
+from Rule import AGGREGATES, AdaptiveRule, RuleSet, compile_rule, compiled_plan, evaluate_rule
+
+def _fan_out_rule(name, entity, value):
+    return {
+        "metadata": {"ruleName": name},
+        "conditions": [{
+            "entity": entity,
+            "filters": [{"field": "k", "operator": "equals", "value": "a"}],
+            "terms": [{"function": "comp", "field": "v", "operator": "equals", "value": value}],
+        }],
+    }
+
+def test_rule_set_fan_out_entities_with_same_filters_do_not_share_rows():
+    # x.items and y.items are fan-out temporaries; the second must not get the first's memoized rows
+    data = {"x": [{"items": [{"k": "a", "v": 1}]}], "y": [{"items": [{"k": "a", "v": 2}]}]}
+    rules = {"r1": _fan_out_rule("r1", "x.items", 1), "r2": _fan_out_rule("r2", "y.items", 2)}
+    expected = {rule_id: compile_rule(rule).evaluate(data, {}) for rule_id, rule in rules.items()}
+    assert expected == {"r1": True, "r2": True}
+    assert RuleSet(rules).evaluate(data, {}) == expected
+
+def _aggregate_rule(func, field, value):
+    return {"conditions": [{"entity": "rows", "terms": [{
+        "function": func, "field": field, "operator": "equals", "value": value,
+        "filters": [{"field": "keep", "operator": "not_equals", "value": False}],  # Not indexed
+    }]}]}
+
+@pytest.mark.parametrize("field", ["name", "big", "mixed", "ratio"])
+@pytest.mark.parametrize("func", sorted(AGGREGATES))
+def test_vectorized_aggregates_match_row_by_row(monkeypatch, func, field):
+    if field == "name" and func in ("sum", "avg"):
+        pytest.skip("strings have no sum")
+    rng = random.Random(3)
+    rows = [{"keep": rng.random() < 0.8,
+             "name": rng.choice(["alpha", "beta", "gamma"]) + str(rng.randint(0, 99)),
+             "big": 2 ** 60 + rng.randint(-1000, 1000),
+             "mixed": rng.choice([1, 2.5, 2 ** 60 + 1]),
+             "ratio": rng.random() * 1e6}
+            for _ in range(2 * Rule.AGGREGATE_VECTOR_THRESHOLD)]
+    expected = AGGREGATES[func]([row[field] for row in rows if row["keep"]])
+    data = {"rows": rows}
+    assert compile_rule(_aggregate_rule(func, field, expected)).evaluate(data, {}) is True
+    monkeypatch.setattr(Rule, "AGGREGATE_VECTOR_THRESHOLD", len(rows) + 1)
+    assert compile_rule(_aggregate_rule(func, field, expected)).evaluate(data, {}) is True
+
+def _rarely_false_first_rule():
+    # Equal costs, so only pass rates can move the decisive second condition first
+    return {"metadata": {"ruleName": "adaptive"}, "conditions": [
+        {"function": "comp", "field": "age", "operator": "gte", "value": 18},
+        {"function": "comp", "field": "status", "operator": "equals", "value": "closed"},
+    ]}
+
+def test_adaptive_rule_reorders_from_collected_stats():
+    rule = compile_rule(_rarely_false_first_rule(), reoptimize_every=10)
+    assert isinstance(rule, AdaptiveRule)
+    for _ in range(50):
+        assert rule.evaluate({"age": 30, "status": "open"}, {}) is False
+    assert rule.reoptimizations == 5
+    assert rule.stats.counts["conditions[1]"][0] == 50
+    assert rule.stats.counts["conditions[0]"][0] == 9  # Skipped once the first reoptimization ran
+
+def test_rule_set_reorders_from_collected_stats():
+    rules = RuleSet({"r": _rarely_false_first_rule()}, reoptimize_every=10)
+    for _ in range(50):
+        assert rules.evaluate({"age": 30, "status": "open"}, {}) == {"r": False}
+    assert rules.reoptimizations == 5
+    assert rules.stats.counts["conditions[0]"][0] == 9
+
+def test_evaluate_rule_plans_follow_rule_version():
+    rule = {"metadata": {"ruleName": "versioned", "ruleVersion": "1", "lastUpdated": "2024-01-01T00:00:00Z"},
+            "conditions": [{"function": "comp", "field": "age", "operator": "gte", "value": 18}]}
+    assert evaluate_rule(rule, {"age": 30}, {}) is True
+    assert compiled_plan(json.loads(json.dumps(rule))) is compiled_plan(rule)  # A parsed copy shares the plan
+    rule["conditions"][0]["value"] = 65
+    rule["metadata"]["ruleVersion"] = "2"
+    assert evaluate_rule(rule, {"age": 30}, {}) is False
@@ -0,0 +1,41 @@
+import random
+import pytest
+from Rule import evaluate_rule
+from rule_batch import RECORD_INDEX, evaluate_rule_batch
+from rule_bench import make_payload, make_variables, v6_rule
+
+def _tables(payloads):
+    """Columnar tables for a batch of payloads: one row per record, or RECORD_INDEX rows for list entities."""
+    tables = {}
+    for position, payload in enumerate(payloads):
+        for entity in ("customer", "branch", "calendar"):
+            for field, value in payload[entity].items():
+                if not isinstance(value, list):
+                    tables.setdefault(entity, {}).setdefault(field, []).append(value)
+        for entity, rows in (("account", payload["account"]), ("audienceSegments", payload["audienceSegments"]),
+                             ("orders", payload["orders"]), ("branch.suppliers", payload["branch"]["suppliers"])):
+            table = tables.setdefault(entity, {})
+            for row in rows:
+                table.setdefault(RECORD_INDEX, []).append(position)
+                for field, value in row.items():
+                    table.setdefault(field, []).append(value)
+    return tables
+
+def test_v6_batch_matches_scalar_evaluation():
+    rng = random.Random(7)
+    payloads = [make_payload(rng, customer_id) for customer_id in range(400)]
+    variables = [make_variables(customer_id, payload) for customer_id, payload in enumerate(payloads)]
+    # Inactive customers pass the root-level customer.age / customer.active_days branch only
+    for payload in payloads[::3]:
+        payload["customer"]["status"] = "inactive"
+    rule = v6_rule()
+
+    expected = [evaluate_rule(rule, payload, vars) for payload, vars in zip(payloads, variables)]
+    columns = {name: [vars[name] for vars in variables] for name in variables[0]}
+    assert evaluate_rule_batch(rule, _tables(payloads), columns).tolist() == expected
+
+def test_dotted_field_into_list_entity_is_rejected():
+    rule = {"conditions": [{"field": "account.balance", "function": "comp", "operator": "gt", "value": 0}]}
+    tables = {"customer": {"age": [30]}, "account": {RECORD_INDEX: [0], "balance": [10]}}
+    with pytest.raises(ValueError):
+        evaluate_rule_batch(rule, tables)
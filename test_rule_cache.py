@@ -0,0 +1,45 @@
+import Rule
+from rule_cache import InMemoryBackend, RuleResultCache
+
+def _rule(minimum, version="1"):
+    return {"metadata": {"ruleName": "AgeRule", "ruleVersion": version, "lastUpdated": "2024-03-03T15:30:00Z"},
+            "cache": {"cachable": True, "ttl": 60, "cacheKey": "${ruleName}_${personaId}"},
+            "conditions": [{"function": "comp", "field": "age", "operator": "gte", "value": minimum}]}
+
+def test_rule_dict_compiled_once(monkeypatch):
+    compiled = []
+    compile_rule = Rule.compile_rule
+    monkeypatch.setattr(Rule, "compile_rule", lambda rule: compiled.append(rule) or compile_rule(rule))
+    rule = _rule(18)
+    cache = RuleResultCache()
+    for _ in range(3):
+        assert cache.evaluate(rule, {"age": 25}, {"personaId": "P1"}) is True
+    assert len(compiled) == 1
+    assert cache.stats()["hits"] == 2
+
+def test_new_version_ignores_backend_results_of_old_version():
+    backend = InMemoryBackend()
+    assert RuleResultCache(backend=backend).evaluate(_rule(18), {"age": 25}, {"personaId": "P1"}) is True
+    # Another process that already runs version 2 shares the backend
+    assert RuleResultCache(backend=backend).evaluate(_rule(65, "2"), {"age": 25}, {"personaId": "P1"}) is False
+
+def test_result_invalidated_during_evaluation_not_written_to_backend():
+    backend = InMemoryBackend()
+    cache = RuleResultCache(backend=backend)
+
+    def fetch():
+        cache.invalidate_rule("AgeRule")  # The rule reloads while this evaluation runs
+        return {"age": 25}
+
+    assert cache.evaluate(_rule(18), fetch, {"personaId": "P1"}) is True
+    assert backend.entries == {}
+    assert cache.stats()["size"] == 0
+
+def test_invalidate_drops_backend_entry():
+    backend = InMemoryBackend()
+    cache = RuleResultCache(backend=backend)
+    rule = _rule(18)
+    cache.evaluate(rule, {"age": 25}, {"personaId": "P1"})
+    cache.invalidate(rule, "AgeRule_P1")
+    assert backend.entries == {}
+    assert cache.stats()["size"] == 0
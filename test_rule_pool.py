@@ -0,0 +1,19 @@
+import random
+from datetime import datetime
+from Rule import evaluate_rule
+from rule_bench import make_payload, make_variables, v3_rule, v6_rule
+from rule_pool import RuleEvaluationPool
+
+def test_pool_matches_scalar_evaluation():
+    rng = random.Random(11)
+    records = []
+    for customer_id in range(300):
+        payload = make_payload(rng, customer_id)
+        payload["customer"]["joined"] = datetime(2020, 1, 1 + customer_id % 28)  # Pickled, so types survive
+        records.append((payload, make_variables(customer_id, payload)))
+    rules = {"v3": v3_rule(), "v6": v6_rule()}
+    expected = [{rule_id: evaluate_rule(rule, data, variables) for rule_id, rule in rules.items()}
+                for data, variables in records]
+
+    with RuleEvaluationPool(rules, processes=2, batch_size=32, max_pending=2) as pool:
+        assert list(pool.evaluate(iter(records))) == expected
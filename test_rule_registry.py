@@ -0,0 +1,36 @@
+from rule_cache import RuleResultCache
+from rule_registry import DictRuleSource, RuleRegistry
+from rule_store import CompiledRuleStore, save_rules
+
+def _rule(name, minimum, version="1", dependencies=()):
+    metadata = {"ruleName": name, "ruleVersion": version, "lastUpdated": "2024-03-03T15:30:00Z"}
+    if dependencies:
+        metadata["dependencies"] = list(dependencies)
+    return {"metadata": metadata, "cache": {"cachable": True, "ttl": 60, "cacheKey": "${personaId}"},
+            "conditions": [{"function": "comp", "field": "age", "operator": "gte", "value": minimum}]}
+
+def _reload_dependency(store):
+    rules = {"A": _rule("A", 18), "B": _rule("B", 21, dependencies=["A"]), "C": _rule("C", 30)}
+    source = DictRuleSource(rules)
+    cache = RuleResultCache()
+    registry = RuleRegistry(source, cache=cache, store=store)
+    registry.refresh()
+    for rule_id in rules:
+        registry.evaluate(rule_id, {"age": 25}, {"personaId": "P1"})
+    assert cache.stats()["size"] == 3
+
+    source.rules["A"] = _rule("A", 65, version="2")
+    assert registry.refresh() == {"A", "B"}
+    assert cache.stats()["size"] == 1  # Only C's result survives
+    assert registry.evaluate("A", {"age": 25}, {"personaId": "P1"}) is False
+    return registry
+
+def test_dependency_reload_without_store():
+    _reload_dependency(None)
+
+def test_dependency_reload_with_store(tmp_path):
+    path = tmp_path / "rules.plan"
+    save_rules(path, {"A": _rule("A", 18), "B": _rule("B", 21, dependencies=["A"]), "C": _rule("C", 30)})
+    with CompiledRuleStore(path) as store:
+        registry = _reload_dependency(store)
+        assert registry.get("B") is store.get("B")  # B still runs the stored plan
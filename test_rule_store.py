@@ -0,0 +1,63 @@
+import json
+import random
+from datetime import datetime, timezone
+from Rule import compile_rule, rule_json
+from rule_bench import make_payload, make_variables, synthetic_rule, v6_rule
+from rule_cache import RuleResultCache
+from rule_registry import rule_dependencies
+from rule_store import CompiledRuleStore, rule_version, save_rules, versions_from_rows
+
+def _v6_rule():
+    """The v6 rule shape with v6.json's version stamp, dependencies and cache block."""
+    rule = v6_rule()
+    rule["metadata"].update(ruleVersion="2.0", lastUpdated="2024-03-03T15:30:00Z",
+                            dependencies=["CustomerRule1", "AccountRule1"])
+    rule["cache"] = {"cachable": True, "ttl": 3600, "cacheKey": "${ruleName}_${personaId}"}
+    return rule
+
+def _rules():
+    rng = random.Random(7)
+    rules = {"v3": json.loads(rule_json), "v6": _v6_rule()}
+    for i in range(20):
+        rules[f"s{i}"] = synthetic_rule(rng, 3, 3)
+    return rules
+
+def test_stored_plans_evaluate_like_their_rules(tmp_path):
+    rules = _rules()
+    path = tmp_path / "rules.plan"
+    save_rules(path, rules)
+    rng = random.Random(11)
+    with CompiledRuleStore(path) as store:
+        for i in range(100):
+            payload = make_payload(rng, i)
+            variables = make_variables(i, payload)
+            for rule_id, rule in rules.items():
+                assert store.get(rule_id).evaluate(payload, variables) == compile_rule(rule).evaluate(payload, variables)
+
+def test_stored_plans_keep_cache_block_and_dependencies(tmp_path):
+    rule = _v6_rule()
+    path = tmp_path / "rules.plan"
+    save_rules(path, {"v6": rule})
+    with CompiledRuleStore(path) as store:
+        stored = store.get("v6")
+        assert rule_dependencies(stored.rule) == rule_dependencies(rule) != []
+        assert stored.rule["cache"] == rule["cache"]
+
+        cache = RuleResultCache()
+        payload = make_payload(random.Random(1), 1)
+        variables = dict(make_variables(1, payload), personaId="P1")
+        first = cache.evaluate(stored, payload, variables)
+        assert cache.evaluate(stored, payload, variables) == first
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_database_rows_match_stored_versions(tmp_path):
+    rule = _v6_rule()
+    path = tmp_path / "rules.plan"
+    save_rules(path, {"v6": rule})
+    version, _ = rule_version(rule)
+    rows = [{"rule_id": "v6", "version": version,
+             "last_updated": datetime(2024, 3, 3, 15, 30, tzinfo=timezone.utc)}]
+    with CompiledRuleStore(path) as store:
+        assert store.stale(versions_from_rows(rows)) == []
+        assert store.is_current("v6", (version, "2024-03-03 15:30:00+00:00"))
+        assert store.stale({"v6": (version, "2024-03-04 15:30:00+00:00")}) == ["v6"]
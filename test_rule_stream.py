@@ -0,0 +1,48 @@
+import io
+import json
+from Rule import RuleSet
+from rule_pool import RuleEvaluationPool
+from rule_stream import stream_evaluate
+
+RULES = {
+    "adult": {"metadata": {"ruleName": "adult"},
+              "conditions": [{"function": "comp", "field": "customer.age", "operator": "gte", "value": 18}]},
+    "rich": {"metadata": {"ruleName": "rich"},
+             "conditions": [{"entity": "account", "terms": [
+                 {"function": "sum", "field": "balance", "operator": "gt", "value": "$threshold"}]}]},
+}
+
+def _input(count):
+    lines = [json.dumps({"data": {"customer": {"customer_id": i, "age": i % 40},
+                                  "account": [{"balance": i * 10}, {"balance": i}]},
+                         "variables": {"threshold": 500}})
+             for i in range(count)]
+    return io.StringIO("\n".join(lines) + "\n")
+
+class _ReadAheadPool:
+    """Stands in for RuleEvaluationPool: reads every record before yielding, like a pool with a deep queue."""
+
+    def __init__(self, rules):
+        self.rules = RuleSet(rules)
+        self.calls = 0
+
+    def evaluate(self, records):
+        self.calls += 1
+        records = list(records)
+        return iter([self.rules.evaluate(data, variables) for data, variables in records])
+
+def test_pool_gets_one_stream_and_results_stay_aligned():
+    expected, output = io.StringIO(), io.StringIO()
+    stream_evaluate(RuleSet(RULES), _input(250), expected, chunk_size=20)
+    pool = _ReadAheadPool(RULES)
+    counts = stream_evaluate(pool, _input(250), output, chunk_size=20)
+    assert pool.calls == 1
+    assert output.getvalue() == expected.getvalue()
+    assert counts["records"] == 250
+
+def test_process_pool_matches_rule_set():
+    expected, output = io.StringIO(), io.StringIO()
+    stream_evaluate(RuleSet(RULES), _input(250), expected, chunk_size=20)
+    with RuleEvaluationPool(RULES, processes=2, batch_size=16, max_pending=3) as pool:
+        stream_evaluate(pool, _input(250), output, chunk_size=20)
+    assert output.getvalue() == expected.getvalue()